@@ -0,0 +1,166 @@
+import logging
+import threading
+import time
+
+from Database import get_db
+
+logger = logging.getLogger(__name__)
+
+# 告警状态
+STATE_ARMED = 'armed'  # 电量正常，下一次低电量立即提醒
+STATE_FIRING = 'firing'  # 刚发送过提醒
+STATE_COOLDOWN = 'cooldown'  # 冷却期内不重复提醒，直到充值或冷却期结束
+STATE_RECOVERED = 'recovered'  # 充值后恢复正常
+
+# 默认参数值
+DEFAULT_COOLDOWN_SECONDS = 6 * 3600
+DEFAULT_RECHARGE_DELTA = 1.0  # 电量比上次回升超过该值(度)时视为充值
+
+
+class RoomAlert:
+    """单个房间的告警状态"""
+
+    __slots__ = ('state', 'last_push_mono', 'last_push_at', 'last_balance', 'suppressed')
+
+    def __init__(self, state=STATE_ARMED, last_push_mono=None, last_push_at=None, last_balance=None):
+        self.state = state
+        self.last_push_mono = last_push_mono  # 进程内比较用的单调时钟时间
+        self.last_push_at = last_push_at  # 持久化用的墙上时间(epoch秒)
+        self.last_balance = last_balance  # 上次检查时的电量，用于识别充值
+        self.suppressed = 0  # 本轮低电量期间被抑制的提醒次数
+
+
+class AlertEngine:
+    """低电量告警状态机 - 按房间冷却去重，状态持久化到SQLite，重启后不会重复提醒
+
+    每次检查前从数据库读取该房间的最新状态，多进程部署时各进程（定时任务、手动测量）共用同一冷却期
+    """
+
+    def __init__(self, cooldown_seconds=DEFAULT_COOLDOWN_SECONDS, recharge_delta=DEFAULT_RECHARGE_DELTA):
+        self.cooldown_seconds = cooldown_seconds
+        self.recharge_delta = recharge_delta
+        self._rooms = {}  # 使用前从数据库刷新
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def init_table(conn):
+        """创建告警状态表"""
+        conn.execute('''CREATE TABLE IF NOT EXISTS alert_state
+                        (room_identifier TEXT PRIMARY KEY,
+                         state TEXT,
+                         last_push_at REAL,  -- 最后一次提醒的时间(epoch秒)
+                         last_balance REAL,  -- 上次检查时的电量
+                         updated_at REAL)''')
+        if 'last_balance' not in [row[1] for row in conn.execute("PRAGMA table_info(alert_state)")]:
+            conn.execute("ALTER TABLE alert_state ADD COLUMN last_balance REAL")
+
+    def _refresh(self, room_identifier=None):
+        """从数据库读取一个或全部房间的最新状态，把持久化的墙上时间换算为单调时钟；抑制次数只在进程内统计"""
+        sql = "SELECT room_identifier, state, last_push_at, last_balance FROM alert_state"
+        params = ()
+        if room_identifier is not None:
+            sql += " WHERE room_identifier = ?"
+            params = (room_identifier,)
+        now_wall, now_mono = time.time(), time.monotonic()
+        for identifier, state, last_push_at, last_balance in get_db().execute(sql, params):
+            alert = self._rooms.setdefault(identifier, RoomAlert())
+            alert.state = state
+            alert.last_push_at = last_push_at
+            alert.last_push_mono = None
+            if last_push_at is not None:
+                alert.last_push_mono = now_mono - max(0.0, now_wall - last_push_at)
+            alert.last_balance = last_balance
+        if room_identifier is not None:
+            return self._rooms.setdefault(room_identifier, RoomAlert())
+        return None
+
+    def _persist(self, room_identifier, alert):
+        """保存单个房间的状态"""
+        conn = get_db()
+        conn.execute('''INSERT INTO alert_state (room_identifier, state, last_push_at, last_balance, updated_at)
+                        VALUES (?, ?, ?, ?, ?)
+                        ON CONFLICT (room_identifier) DO UPDATE SET
+                            state = excluded.state,
+                            last_push_at = excluded.last_push_at,
+                            last_balance = excluded.last_balance,
+                            updated_at = excluded.updated_at''',
+                     (room_identifier, alert.state, alert.last_push_at, alert.last_balance, time.time()))
+        conn.commit()
+
+    def evaluate(self, room_identifier, alerting, balance=None):
+        """
+        根据本次检查结果推进状态机
+
+        只有电量回升（充值）才解除告警；只是不再满足提醒条件时（如耗尽预测在阈值附近来回波动）
+        保持冷却，冷却期结束后才重新就绪，避免反复提醒。
+        返回 True 时本方法不记录提醒，调用方在提醒成功入队后调用 record_push()，
+        入队失败时不会进入冷却期
+
+        Args:
+            room_identifier (str): 房间标识符
+            alerting (bool): 本次是否满足提醒条件（低于阈值或即将耗尽）
+            balance (float): 本次查询到的电量，用于识别充值
+
+        Returns:
+            bool: 是否需要发送提醒
+        """
+        with self._lock:
+            alert = self._refresh(room_identifier)
+            previous_state, previous_balance = alert.state, alert.last_balance
+            recharged = (balance is not None and previous_balance is not None
+                         and balance - previous_balance >= self.recharge_delta)
+            if balance is not None:
+                alert.last_balance = balance
+            cooled = (alert.last_push_mono is None
+                      or time.monotonic() - alert.last_push_mono >= self.cooldown_seconds)
+            should_push = False
+
+            if alerting:
+                if alert.state in (STATE_ARMED, STATE_RECOVERED) or cooled:
+                    should_push = True
+                else:
+                    alert.state = STATE_COOLDOWN
+                    alert.suppressed += 1
+            elif alert.state in (STATE_FIRING, STATE_COOLDOWN):
+                if recharged:
+                    alert.state = STATE_RECOVERED
+                    logger.info(f"房间 {room_identifier} 已充值，告警解除")
+                elif cooled:
+                    alert.state = STATE_ARMED
+            elif alert.state == STATE_RECOVERED:
+                alert.state = STATE_ARMED
+
+            # 告警期间电量变化也要保存，重启后仍能识别充值
+            if alert.state != previous_state or (
+                    alert.state in (STATE_FIRING, STATE_COOLDOWN) and alert.last_balance != previous_balance):
+                self._persist(room_identifier, alert)
+            if not should_push and alert.state == STATE_COOLDOWN:
+                logger.info(f"房间 {room_identifier} 处于冷却期，已抑制{alert.suppressed}次提醒")
+            return should_push
+
+    def record_push(self, room_identifier):
+        """提醒已成功入队，进入冷却期"""
+        with self._lock:
+            alert = self._refresh(room_identifier)
+            alert.state = STATE_FIRING
+            alert.last_push_mono = time.monotonic()
+            alert.last_push_at = time.time()
+            alert.suppressed = 0
+            self._persist(room_identifier, alert)
+
+    def snapshot(self):
+        """所有房间的当前告警状态"""
+        with self._lock:
+            self._refresh()
+            now_mono = time.monotonic()
+            return {
+                room_identifier: {
+                    'state': alert.state,
+                    'last_push_at': alert.last_push_at,
+                    'cooldown_remaining': (
+                        max(0, round(self.cooldown_seconds - (now_mono - alert.last_push_mono)))
+                        if alert.last_push_mono is not None else 0),
+                    'suppressed': alert.suppressed
+                }
+                for room_identifier, alert in self._rooms.items()
+            }
@@ -1,53 +1,18 @@
 import urllib.parse
-from typing import Dict, Any
+from functools import lru_cache
+from typing import Dict, Any, Tuple
 import logging
 
 logger = logging.getLogger(__name__)
 
+# 校区名称映射
+AREA_MAP = {'2': '奉贤', '3': '徐汇'}
 
-class WechatMsgGenerator:
-    def __init__(self, url: str):
-        self.url = url
-        self.params = self._parse_url()
-
-    def _parse_url(self) -> Dict[str, Any]:
-        """解析URL参数并返回参数字典"""
-        parsed_url = urllib.parse.urlparse(self.url)
-        query_params = urllib.parse.parse_qs(parsed_url.query)
-
-        # 提取参数值
-        params = {}
-        params['roomid'] = query_params.get('roomid', [''])[0]  # 房间号
-        params['areaid'] = query_params.get('areaid', [''])[0]  # 校区ID
-        params['buildid'] = query_params.get('buildid', [''])[0]  # 楼号
-        params['amount'] = query_params.get('amount', [''])[0]  # 金额
-
-        # 校区名称映射
-        area_map = {'2': '奉贤', '3': '徐汇'}
-        params['area_name'] = area_map.get(params['areaid'], '未知校区')
-
-        return params
-
-    def generate_title(self) -> str:
-        """生成标题，格式如'奉贤3号楼103电费100元'"""
-        params = self.params
-        # 处理金额显示，如果是整数则显示整数，否则保留两位小数
-        try:
-            amount = float(params['amount'])
-            if amount.is_integer():
-                amount_str = str(int(amount))
-            else:
-                amount_str = f"{amount:.2f}"
-        except (ValueError, TypeError):
-            amount_str = params['amount']
-
-        title = f"{params['area_name']}{params['buildid']}号楼{params['roomid']}电费{amount_str}元"
-        return title
+# 缓存的充值消息数量（按房间和金额）
+MESSAGE_CACHE_SIZE = 256
 
-    def generate_html(self) -> str:
-        """生成HTML文本，使用提供的模板并填充URL"""
-        # HTML模板
-        html_template = """<!DOCTYPE html>
+# 充值页面HTML模板，{url} 为缴费链接占位符
+RECHARGE_HTML_TEMPLATE = """<!DOCTYPE html>
     <html lang="zh-CN">
     <head>
         <meta charset="UTF-8">
@@ -215,9 +180,59 @@ class WechatMsgGenerator:
     </body>
     </html>"""
 
-        # 使用传入的URL替换模板中的占位符
-        html_content = html_template.replace("{url}", self.url)
-        return html_content
+# 模板在导入时按占位符切分一次，渲染时只需拼接
+_RECHARGE_TEMPLATE_PARTS = RECHARGE_HTML_TEMPLATE.split("{url}")
+
+
+@lru_cache(maxsize=MESSAGE_CACHE_SIZE)
+def _parse_recharge_params(url: str) -> Tuple[Tuple[str, str], ...]:
+    """解析URL参数，结果按URL缓存"""
+    parsed_url = urllib.parse.urlparse(url)
+    query_params = urllib.parse.parse_qs(parsed_url.query)
+
+    # 提取参数值
+    params = {}
+    params['roomid'] = query_params.get('roomid', [''])[0]  # 房间号
+    params['areaid'] = query_params.get('areaid', [''])[0]  # 校区ID
+    params['buildid'] = query_params.get('buildid', [''])[0]  # 楼号
+    params['amount'] = query_params.get('amount', [''])[0]  # 金额
+    params['area_name'] = AREA_MAP.get(params['areaid'], '未知校区')
+
+    return tuple(params.items())
+
+
+class WechatMsgGenerator:
+    def __init__(self, url: str):
+        self.url = url
+        self.params = self._parse_url()
+
+    def _parse_url(self) -> Dict[str, Any]:
+        """解析URL参数并返回参数字典"""
+        return dict(_parse_recharge_params(self.url))
+
+    def generate_title(self) -> str:
+        """生成标题，格式如'奉贤3号楼103电费100元'"""
+        params = self.params
+        # 处理金额显示，如果是整数则显示整数，否则保留两位小数
+        try:
+            amount = float(params['amount'])
+            if amount.is_integer():
+                amount_str = str(int(amount))
+            else:
+                amount_str = f"{amount:.2f}"
+        except (ValueError, TypeError):
+            amount_str = params['amount']
+
+        title = f"{params['area_name']}{params['buildid']}号楼{params['roomid']}电费{amount_str}元"
+        return title
+
+    def generate_html(self) -> str:
+        """生成HTML文本，使用模块级预切分的模板填充URL"""
+        return self.url.join(_RECHARGE_TEMPLATE_PARTS)
+
+    def generate_text(self) -> str:
+        """生成纯文本短消息，用于按字数计费的短信渠道"""
+        return f"{self.generate_title()}，缴费链接: {self.url}（若打不开先登录华信）"
 
 
 def generate_recharge_url(query_url, amount):
@@ -260,4 +275,86 @@ def generate_recharge_url(query_url, amount):
 
     except Exception as e:
         logger.error(f"生成充值URL失败: {e}")
-        return None
\ No newline at end of file
+        return None
+
+@lru_cache(maxsize=MESSAGE_CACHE_SIZE)
+def build_recharge_message(query_url, amount):
+    """
+    生成快捷充值消息，按 (查询URL, 金额) 缓存，同一房间重复充值推送无需重新渲染
+
+    Returns:
+        (充值URL, 标题, HTML, 纯文本)，生成充值URL失败时返回 None
+    """
+    recharge_url = generate_recharge_url(query_url, amount)
+    if not recharge_url:
+        return None
+    msg_generator = WechatMsgGenerator(recharge_url)
+    return recharge_url, msg_generator.generate_title(), msg_generator.generate_html(), msg_generator.generate_text()
+
+
+class AlertDigestGenerator:
+    """低电量汇总消息生成类 - 一轮查询中的多个房间合并为一条推送"""
+
+    def __init__(self, alerts, recharge_amount=100):
+        """
+        Args:
+            alerts: 告警列表，每项包含 room_info、balance、url，可选 hours_to_empty
+            recharge_amount: 每个房间充值链接的金额
+        """
+        self.alerts = alerts
+        self.recharge_amount = recharge_amount
+
+    def generate_title(self) -> str:
+        """生成标题，格式如'电量告急：3个房间'"""
+        return f"电量告急：{len(self.alerts)}个房间"
+
+    def generate_text(self) -> str:
+        """生成纯文本汇总，用于按字数计费的短信渠道"""
+        rooms = '；'.join(f"{alert['room_info']}{alert['balance']}度"
+                         for alert in sorted(self.alerts, key=lambda item: float(item['balance'])))
+        return f"{self.generate_title()}：{rooms}，请及时充值"
+
+    def generate_html(self) -> str:
+        """生成汇总HTML，每个房间一行，附带充值链接"""
+        rows = []
+        for alert in sorted(self.alerts, key=lambda item: float(item['balance'])):
+            forecast = ''
+            if alert.get('hours_to_empty') is not None:
+                forecast = f"<div class=\"forecast\">预计约{alert['hours_to_empty']}小时后用完</div>"
+            recharge_url = generate_recharge_url(alert['url'], self.recharge_amount)
+            link = f"<a class=\"btn\" href=\"{recharge_url}\" target=\"_blank\">充值</a>" if recharge_url else ''
+            rows.append(f"""
+            <div class="row">
+                <div class="info">
+                    <div class="room">{alert['room_info']}</div>
+                    <div class="balance">剩余 {alert['balance']} 度</div>
+                    {forecast}
+                </div>
+                {link}
+            </div>""")
+
+        return f"""<!DOCTYPE html>
+    <html lang="zh-CN">
+    <head>
+        <meta charset="UTF-8">
+        <meta name="viewport" content="width=device-width, initial-scale=1.0">
+        <title>电量告急</title>
+        <style>
+            body {{ font-family: -apple-system, 'PingFang SC', 'Microsoft YaHei', sans-serif; background: #f5f7fa; padding: 15px; }}
+            .container {{ background: white; border-radius: 12px; max-width: 360px; margin: 0 auto; padding: 20px; }}
+            h1 {{ color: #c0392b; font-size: 20px; margin-bottom: 15px; text-align: center; }}
+            .row {{ display: flex; justify-content: space-between; align-items: center; padding: 10px 0; border-bottom: 1px solid #e9ecef; }}
+            .room {{ color: #2c3e50; font-weight: 600; font-size: 15px; }}
+            .balance {{ color: #e74c3c; font-size: 14px; }}
+            .forecast {{ color: #7f8c8d; font-size: 12px; }}
+            .btn {{ background: #3498db; color: white; padding: 6px 14px; border-radius: 6px; text-decoration: none; font-size: 14px; }}
+            .footer {{ margin-top: 15px; color: #95a5a6; font-size: 12px; text-align: center; }}
+        </style>
+    </head>
+    <body>
+        <div class="container">
+            <h1>{self.generate_title()}</h1>{''.join(rows)}
+            <div class="footer">若充值链接打不开，请先登录华信</div>
+        </div>
+    </body>
+    </html>"""
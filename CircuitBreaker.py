@@ -0,0 +1,114 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# 熔断器状态
+STATE_CLOSED = 'closed'  # 正常放行
+STATE_OPEN = 'open'  # 已熔断，请求直接失败
+STATE_HALF_OPEN = 'half_open'  # 退避结束，放行一次探测请求
+
+# 默认参数值
+DEFAULT_FAILURE_THRESHOLD = 5  # 连续失败多少次后熔断
+DEFAULT_BASE_BACKOFF = 30.0  # 首次熔断的等待时间(秒)
+DEFAULT_MAX_BACKOFF = 1800.0  # 退避时间上限(秒)
+
+
+class CircuitBreaker:
+    """主机级熔断器 - 连续失败后熔断，按指数退避放行探测请求"""
+
+    def __init__(self, name, failure_threshold=DEFAULT_FAILURE_THRESHOLD,
+                 base_backoff=DEFAULT_BASE_BACKOFF, max_backoff=DEFAULT_MAX_BACKOFF):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.base_backoff = base_backoff
+        self.max_backoff = max_backoff
+        self._lock = threading.Lock()
+        self.state = STATE_CLOSED
+        self.consecutive_failures = 0
+        self.backoff = base_backoff
+        self.open_until = 0.0  # 单调时钟时间
+        self.trips = 0  # 熔断次数
+        self.rejected = 0  # 熔断期间直接拒绝的请求数
+        self.successes = 0
+        self.failures = 0
+
+    def allow(self):
+        """是否放行本次请求；半开状态只放行一个探测请求"""
+        with self._lock:
+            if self.state == STATE_CLOSED:
+                return True
+            if self.state == STATE_OPEN and time.monotonic() >= self.open_until:
+                self.state = STATE_HALF_OPEN
+                logger.info(f"熔断器 {self.name} 进入半开状态，发送探测请求")
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        """记录一次成功，半开探测成功后恢复正常"""
+        with self._lock:
+            self.successes += 1
+            self.consecutive_failures = 0
+            if self.state != STATE_CLOSED:
+                logger.info(f"熔断器 {self.name} 探测成功，恢复正常")
+            self.state = STATE_CLOSED
+            self.backoff = self.base_backoff
+
+    def record_failure(self):
+        """记录一次失败，达到阈值或探测失败时熔断"""
+        with self._lock:
+            self.failures += 1
+            self.consecutive_failures += 1
+            if self.state == STATE_HALF_OPEN:
+                # 探测失败，退避时间加倍
+                self.backoff = min(self.backoff * 2, self.max_backoff)
+                self._trip()
+            elif self.state == STATE_CLOSED and self.consecutive_failures >= self.failure_threshold:
+                self._trip()
+
+    def _trip(self):
+        """进入熔断状态，调用方需持有锁"""
+        self.state = STATE_OPEN
+        self.open_until = time.monotonic() + self.backoff
+        self.trips += 1
+        logger.warning(f"熔断器 {self.name} 已熔断，{self.backoff:.0f}秒后探测")
+
+    def snapshot(self):
+        """当前状态和计数"""
+        with self._lock:
+            return {
+                'state': self.state,
+                'consecutive_failures': self.consecutive_failures,
+                'retry_in': max(0, round(self.open_until - time.monotonic())) if self.state == STATE_OPEN else 0,
+                'backoff': self.backoff,
+                'trips': self.trips,
+                'rejected': self.rejected,
+                'successes': self.successes,
+                'failures': self.failures
+            }
+
+
+# 按主机缓存的熔断器
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(host):
+    """获取某个主机的熔断器，不存在时创建"""
+    breaker = _breakers.get(host)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.get(host)
+            if breaker is None:
+                breaker = CircuitBreaker(host)
+                _breakers[host] = breaker
+    return breaker
+
+
+def get_breaker_states():
+    """所有主机熔断器的状态"""
+    with _breakers_lock:
+        breakers = list(_breakers.values())
+    return {breaker.name: breaker.snapshot() for breaker in breakers}
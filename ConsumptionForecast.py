@@ -0,0 +1,109 @@
+import logging
+import math
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# 默认参数值
+DEFAULT_HALF_LIFE_HOURS = 12.0  # 用电速率指数加权的半衰期(小时)
+DEFAULT_RECHARGE_JUMP = 0.5  # 电量上升超过该值(度)视为充值
+MIN_INTERVAL_SECONDS = 60  # 两次样本间隔过短时不更新速率，避免噪声
+
+
+class RoomEstimate:
+    """单个房间的用电速率估计状态"""
+
+    __slots__ = ('balance', 'timestamp', 'rate', 'samples', 'recharges')
+
+    def __init__(self, balance, timestamp):
+        self.balance = balance
+        self.timestamp = timestamp
+        self.rate = None  # 度/小时，尚无有效样本时为 None
+        self.samples = 1
+        self.recharges = 0
+
+
+class ConsumptionEstimator:
+    """用电速率估计类 - 按时间加权的指数滑动平均，每个新样本 O(1) 更新"""
+
+    def __init__(self, half_life_hours=DEFAULT_HALF_LIFE_HOURS, recharge_jump=DEFAULT_RECHARGE_JUMP):
+        self.half_life_hours = half_life_hours
+        self.recharge_jump = recharge_jump
+        self._rooms = {}
+        self._lock = threading.Lock()
+
+    def update(self, room_identifier, balance, timestamp=None):
+        """
+        加入一个新样本
+
+        Args:
+            room_identifier (str): 房间标识符
+            balance (float): 当前剩余电量
+            timestamp (float): 样本时间(epoch秒)，默认当前时间
+        """
+        balance = float(balance)
+        timestamp = time.time() if timestamp is None else timestamp
+
+        with self._lock:
+            state = self._rooms.get(room_identifier)
+            if state is None:
+                self._rooms[room_identifier] = RoomEstimate(balance, timestamp)
+                return
+
+            elapsed = timestamp - state.timestamp
+            if elapsed < MIN_INTERVAL_SECONDS:
+                return
+
+            delta = balance - state.balance
+            if delta > self.recharge_jump:
+                # 充值：电量跳升，不参与速率估计，只更新基准
+                state.recharges += 1
+                logger.info(f"检测到房间 {room_identifier} 充值: +{delta:.2f}度")
+            else:
+                observed_rate = max(-delta, 0.0) / (elapsed / 3600)
+                # 间隔越长，新样本权重越大
+                alpha = 1 - math.exp(-math.log(2) * (elapsed / 3600) / self.half_life_hours)
+                if state.rate is None:
+                    state.rate = observed_rate
+                else:
+                    state.rate += alpha * (observed_rate - state.rate)
+
+            state.balance = balance
+            state.timestamp = timestamp
+            state.samples += 1
+
+    def forecast(self, room_identifier):
+        """
+        预测房间电量耗尽时间
+
+        Returns:
+            dict: 当前电量、速率(度/小时)、预计剩余小时数；无数据时返回 None
+        """
+        with self._lock:
+            state = self._rooms.get(room_identifier)
+            if state is None:
+                return None
+            rate = state.rate
+            hours_to_empty = None
+            if rate is not None and rate > 0:
+                hours_to_empty = state.balance / rate
+            return {
+                'room_identifier': room_identifier,
+                'balance': state.balance,
+                'rate_per_hour': round(rate, 4) if rate is not None else None,
+                'hours_to_empty': round(hours_to_empty, 1) if hours_to_empty is not None else None,
+                'samples': state.samples,
+                'recharges': state.recharges,
+                'updated_at': state.timestamp
+            }
+
+    def has_room(self, room_identifier):
+        """是否已有该房间的估计状态"""
+        with self._lock:
+            return room_identifier in self._rooms
+
+    def rooms(self):
+        """已跟踪的房间列表"""
+        with self._lock:
+            return list(self._rooms)
@@ -0,0 +1,104 @@
+import atexit
+import logging
+import os
+import sqlite3
+import threading
+
+logger = logging.getLogger(__name__)
+
+# 默认参数值
+# 数据库放在 DATA_DIR 目录（默认当前目录）；WAL模式下 -wal/-shm 文件与数据库同目录，
+# 容器部署时需挂载整个目录，只挂载数据库文件会丢失尚未检查点的事务
+DEFAULT_DB_PATH = os.path.join(os.environ.get('DATA_DIR', '.'), 'electricity.db')
+DEFAULT_CACHE_SIZE_KB = 8192  # 页缓存大小(KB)
+DEFAULT_BUSY_TIMEOUT_MS = 5000  # 写锁等待时间(毫秒)
+DEFAULT_CACHED_STATEMENTS = 256  # 每个连接缓存的预编译语句数量
+DEFAULT_MAX_IDLE = 8  # 已结束线程留下、等待新线程复用的连接数上限
+
+
+class ConnectionManager:
+    """SQLite连接管理类 - 每个线程复用一个长连接，启用WAL日志
+
+    线程结束后其连接放回空闲池，由之后的新线程复用；开发服务器每个请求一个新线程，
+    也不会每个请求都新建连接和设置PRAGMA
+    """
+
+    def __init__(self, db_path=DEFAULT_DB_PATH, cache_size_kb=DEFAULT_CACHE_SIZE_KB,
+                 busy_timeout_ms=DEFAULT_BUSY_TIMEOUT_MS, max_idle=DEFAULT_MAX_IDLE):
+        self.db_path = db_path
+        self.cache_size_kb = cache_size_kb
+        self.busy_timeout_ms = busy_timeout_ms
+        self.max_idle = max_idle
+        self._local = threading.local()
+        self._connections = {}  # 线程ID -> (线程, 连接)
+        self._idle = []  # 已结束线程留下的连接
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        """创建新连接并设置PRAGMA"""
+        # 连接只在所属线程使用，关闭时可能由其他线程执行，因此关闭同线程检查
+        conn = sqlite3.connect(self.db_path, check_same_thread=False,
+                               cached_statements=DEFAULT_CACHED_STATEMENTS)
+        # 增量回收只能在建表前开启，对已有数据库无效（由数据压缩任务切换）
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        # WAL模式下写入不阻塞读取，调度任务写数据时页面查询不受影响
+        conn.execute("PRAGMA journal_mode=WAL")
+        # WAL下NORMAL只在检查点时fsync，断电最多丢失最近的事务，不会损坏数据库
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA cache_size=-{int(self.cache_size_kb)}")
+        conn.execute("PRAGMA temp_store=MEMORY")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        return conn
+
+    def _reclaim_dead_threads(self):
+        """把已结束线程遗留的连接（如请求线程、线程池线程）放回空闲池，超过上限的关闭"""
+        for ident, (thread, conn) in list(self._connections.items()):
+            if thread.is_alive():
+                continue
+            del self._connections[ident]
+            try:
+                # 线程结束时可能留有未提交的事务
+                conn.rollback()
+                if len(self._idle) < self.max_idle:
+                    self._idle.append(conn)
+                else:
+                    conn.close()
+            except Exception as e:
+                logger.error(f"回收数据库连接失败: {e}")
+
+    def get_connection(self):
+        """获取当前线程的数据库连接，不存在时优先复用空闲连接，否则创建"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            thread = threading.current_thread()
+            with self._lock:
+                self._reclaim_dead_threads()
+                conn = self._idle.pop() if self._idle else None
+            if conn is None:
+                conn = self._connect()
+            self._local.conn = conn
+            with self._lock:
+                self._connections[thread.ident] = (thread, conn)
+        return conn
+
+    def close_all(self):
+        """关闭所有线程的连接，用于进程退出或切换数据库"""
+        with self._lock:
+            for conn in [conn for _, conn in self._connections.values()] + self._idle:
+                try:
+                    conn.close()
+                except Exception as e:
+                    logger.error(f"关闭数据库连接失败: {e}")
+            self._connections.clear()
+            self._idle.clear()
+        self._local = threading.local()
+
+
+# 进程内共享的连接管理器
+db_manager = ConnectionManager()
+atexit.register(db_manager.close_all)
+
+
+def get_db():
+    """获取当前线程的数据库连接"""
+    return db_manager.get_connection()
@@ -1,16 +1,48 @@
 import requests
 import logging
 import argparse
+import os
+import threading
+from urllib.parse import urlparse, urlunparse
+from requests.adapters import HTTPAdapter
 from bs4 import BeautifulSoup
 import re
+import time
 import datetime
 
+from CircuitBreaker import get_breaker
+import Metrics
+
+# lxml为可选依赖，安装后启用基于lxml的快速解析
+try:
+    import lxml.html
+    HAS_LXML = True
+except ImportError:
+    HAS_LXML = False
+
 # 默认参数值
 DEFAULT_HTML_ENCODE = 'utf-8'
 DEFAULT_URL = 'https://yktyd.ecust.edu.cn/epay/wxpage/wanxiao/eleresult?sysid=1&roomid=103&areaid=2&buildid=3'
 DEFAULT_AGENT_WECHAT = 'Mozilla/5.0 (Linux; Android 10; MI 9 Build/QKQ1.190825.002; wv) AppleWebKit/537.36 (KHTML, like Gecko) Version/4.0 Chrome/78.0.3904.62 XWEB/2797 MMWEBSDK/20220101 Mobile Safari/537.36 MMWEBID/8070 MicroMessenger/8.0.20.2100(0x28001451) WeChat/arm64 Weixin NetType/WIFI Language/zh_CN ABI/arm64'
 DEFAULT_AGENT_AND10 = 'Mozilla/5.0 (Linux; Android 10; MI 9 Build/QKQ1.190825.002; wv) AppleWebKit/537.36'
 DEFAULT_REFERER = 'https://yktyd.ecust.edu.cn/'
+# 设置后把查询URL的协议和主机替换为该地址（如本地测试服务器），路径和房间参数保持不变
+DEFAULT_BASE_URL = os.environ.get('ELECTRICITY_BASE_URL', '')
+DEFAULT_POOL_CONNECTIONS = 4  # 缓存的主机连接池数量
+DEFAULT_POOL_MAXSIZE = 16  # 每个主机连接池保持的最大长连接数
+
+# 预编译的解析正则，快速路径无需构建DOM
+NUMBER_RE = re.compile(r'([\d.]+)')
+LEFT_DEGREE_RE = re.compile(r'left-degree="([\d.]+)"')
+WEUI_LABEL_RE = re.compile(r'剩余电量\s*</label>\s*(?:</div>\s*)?<div[^>]*>\s*([\d.]+)')
+DEGREE_RE = re.compile(r'(\d+\.?\d*)\s*度')
+
+# 监控指标：请求耗时按主机和状态码区分，解析耗时为线程CPU时间
+FETCH_SECONDS = Metrics.histogram('electricity_fetch_seconds', '电量页面请求耗时(秒)', ('host', 'status'),
+                                  buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 15.0, 30.0))
+PARSE_TOTAL = Metrics.counter('electricity_parse_total', '各解析策略命中次数，failed 为全部策略失败', ('strategy',))
+PARSE_CPU_SECONDS = Metrics.histogram('electricity_parse_cpu_seconds', '解析页面消耗的CPU时间(秒)', ('strategy',),
+                                      buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25))
 
 
 # 配置日志
@@ -24,6 +56,121 @@ def setup_logging():
 
 logger = setup_logging()
 
+# 进程内共享的长连接会话，跨房间、跨调度轮次复用TCP/TLS连接
+_shared_session = None
+_shared_pool_sizes = (DEFAULT_POOL_CONNECTIONS, DEFAULT_POOL_MAXSIZE)  # 共享会话的 (主机池数量, 每主机长连接数)
+_session_lock = threading.Lock()
+
+
+def create_session(pool_connections=DEFAULT_POOL_CONNECTIONS, pool_maxsize=DEFAULT_POOL_MAXSIZE):
+    """创建带连接池的会话"""
+    session = requests.Session()
+    adapter = HTTPAdapter(pool_connections=pool_connections, pool_maxsize=pool_maxsize)
+    session.mount('http://', adapter)
+    session.mount('https://', adapter)
+    return session
+
+
+def get_shared_session():
+    """获取共享会话，首次调用时创建"""
+    global _shared_session
+    if _shared_session is None:
+        with _session_lock:
+            if _shared_session is None:
+                _shared_session = create_session(*_shared_pool_sizes)
+    return _shared_session
+
+
+def configure_shared_session(pool_connections=DEFAULT_POOL_CONNECTIONS, pool_maxsize=DEFAULT_POOL_MAXSIZE):
+    """
+    调整共享会话的连接池大小，大小未变化时不做任何事
+
+    已创建的会话换用新的连接池（连接复用统计重新开始），正在进行的请求继续使用原连接池
+    """
+    global _shared_pool_sizes
+    sizes = (max(1, int(pool_connections)), max(1, int(pool_maxsize)))
+    with _session_lock:
+        if sizes == _shared_pool_sizes:
+            return
+        _shared_pool_sizes = sizes
+        if _shared_session is not None:
+            adapter = HTTPAdapter(pool_connections=sizes[0], pool_maxsize=sizes[1])
+            _shared_session.mount('http://', adapter)
+            _shared_session.mount('https://', adapter)
+    logger.info(f"共享会话连接池已调整: 主机池{sizes[0]}个, 每主机长连接{sizes[1]}个")
+
+
+def get_connection_stats(session=None):
+    """
+    统计会话的连接复用情况
+
+    Returns:
+        dict: requests 为发出的请求数，connections_opened 为新建连接数，
+              connections_reused 为复用已有长连接的请求数
+    """
+    session = session or get_shared_session()
+    total_requests = 0
+    total_connections = 0
+    adapters = {id(adapter): adapter for adapter in session.adapters.values()}
+    for adapter in adapters.values():
+        pool_manager = getattr(adapter, 'poolmanager', None)
+        if pool_manager is None:
+            continue
+        for key in list(pool_manager.pools.keys()):
+            pool = pool_manager.pools.get(key)
+            if pool is None:
+                continue
+            total_requests += pool.num_requests
+            total_connections += pool.num_connections
+    return {
+        'requests': total_requests,
+        'connections_opened': total_connections,
+        'connections_reused': max(0, total_requests - total_connections)
+    }
+
+
+def record_strategy_hit(strategy):
+    """记录一次解析结果，strategy 为 None 表示全部策略失败"""
+    PARSE_TOTAL.inc(strategy or 'failed')
+
+
+def get_strategy_stats():
+    """获取各解析策略的命中次数，用于根据实际命中率调整策略顺序"""
+    return {labels[0]: count for labels, count in PARSE_TOTAL.items()}
+
+
+# 按URL缓存的条件请求校验值和上次页面，页面未变化时跳过下载和解析
+_page_cache = {}  # url -> {'etag', 'last_modified', 'html', 'balance', 'strategy'}
+_page_cache_lock = threading.Lock()
+_conditional_stats = {'conditional_requests': 0, 'not_modified': 0, 'unchanged_body': 0}
+
+
+def _count_conditional(key):
+    """累加条件请求统计"""
+    with _page_cache_lock:
+        _conditional_stats[key] += 1
+
+
+def get_conditional_stats():
+    """
+    统计条件请求的效果
+
+    Returns:
+        dict: conditional_requests 为携带校验值的请求数，not_modified 为服务端返回304的次数，
+              unchanged_body 为页面内容未变化、复用上次解析结果的次数
+    """
+    with _page_cache_lock:
+        return dict(_conditional_stats)
+
+
+def resolve_url(url, base_url=None):
+    """把URL的协议和主机替换为 base_url（默认读取 ELECTRICITY_BASE_URL），未设置时原样返回"""
+    base_url = base_url or DEFAULT_BASE_URL
+    if not base_url or not url:
+        return url
+    base = urlparse(base_url)
+    return urlunparse(urlparse(url)._replace(scheme=base.scheme, netloc=base.netloc))
+
 
 class ElectricityQuery:
     """电费查询类"""
@@ -31,113 +178,260 @@ class ElectricityQuery:
     def __init__(self, html_encode=DEFAULT_HTML_ENCODE, url=DEFAULT_URL,
                  agent_wechat=DEFAULT_AGENT_WECHAT, agent_and10=DEFAULT_AGENT_AND10,
                  referer=DEFAULT_REFERER,
-                 timeout=15):
+                 timeout=15, session=None, conditional=True, base_url=None):
         self.html_encode = html_encode
-        self.url = url
+        self.url = resolve_url(url, base_url)
         self.agent_wechat = agent_wechat
         self.agent_and10 = agent_and10
         self.referer = referer
         self.timeout = timeout
+        # 未传入会话时使用进程内共享的长连接会话
+        self.session = session or get_shared_session()
+        self.last_html = None  # 最近一次获取的页面，供调试保存复用
+        self.last_strategy = None  # 最近一次命中的解析策略
+        self.conditional = conditional  # 是否发送 If-None-Match / If-Modified-Since 条件请求
+        self.not_modified = False  # 最近一次请求是否返回304
+
+    # 解析策略，按开销从低到高排列：正则快速路径、lxml（可选），最后才用BeautifulSoup；
+    # 宽松的"数字+度"匹配最容易误判，放在最后兜底
+    PARSE_STRATEGIES = (
+        ('left_degree_regex', '_parse_left_degree_regex'),
+        ('weui_label_regex', '_parse_weui_label_regex'),
+    ) + ((('lxml_weui_cell', '_parse_lxml_weui_cell'),) if HAS_LXML else ()) + (
+        ('roomdef_attr', '_parse_roomdef_attr'),
+        ('weui_label', '_parse_weui_label'),
+        ('weui_cell_scan', '_parse_weui_cell_scan'),
+        ('degree_regex', '_parse_degree_regex'),
+    )
 
-    def get_electricity_fixed(self):
-        """针对具体HTML结构优化的电费查询函数"""
+    def fetch_html(self, user_agent=None):
+        """获取查询页面HTML，失败返回None；所在主机熔断期间直接失败，不发出请求
+
+        服务端支持 ETag/Last-Modified 时发送条件请求，返回304时复用上次的页面
+        """
         headers = {
-            'User-Agent': self.agent_wechat,
+            'User-Agent': user_agent or self.agent_wechat,
             'Referer': self.referer
         }
+        self.not_modified = False
+
+        cached = _page_cache.get(self.url) if self.conditional else None
+        if cached:
+            if cached.get('etag'):
+                headers['If-None-Match'] = cached['etag']
+            if cached.get('last_modified'):
+                headers['If-Modified-Since'] = cached['last_modified']
+
+        breaker = get_breaker(urlparse(self.url).netloc)
+        if not breaker.allow():
+            logger.warning(f"主机 {breaker.name} 已熔断，跳过本次查询")
+            return None
 
+        if 'If-None-Match' in headers or 'If-Modified-Since' in headers:
+            _count_conditional('conditional_requests')
+
+        started = time.perf_counter()
         try:
             logger.info("开始查询电量信息...")
-            response = requests.get(self.url, headers=headers, timeout=self.timeout)
-            response.encoding = 'utf-8'
+            response = self.session.get(self.url, headers=headers, timeout=self.timeout)
+            response.encoding = self.html_encode
+            FETCH_SECONDS.observe(time.perf_counter() - started, breaker.name, str(response.status_code))
+
+            # 5xx 说明服务端异常，计入熔断；其余状态码说明服务端仍可响应
+            if response.status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+
+            if response.status_code == 304 and cached:
+                logger.info("页面未变化(304)，复用上次的结果")
+                _count_conditional('not_modified')
+                self.not_modified = True
+                self.last_html = cached['html']
+                return cached['html']
 
             if response.status_code != 200:
                 logger.error(f"请求失败，状态码: {response.status_code}")
                 return None
 
-            soup = BeautifulSoup(response.text, 'html.parser')
-
-            # 方法1：直接提取包含电量的div文本
-            remaining_label = soup.find('label', class_='weui-label', string='剩余电量')
-            if remaining_label:
-                parent_div = remaining_label.find_parent('div', class_='weui-cell')
-                if parent_div:
-                    value_div = parent_div.find('div')
-                    if value_div and value_div.text.strip():
-                        balance_text = value_div.text.strip()
-                        logger.info(f"通过方法1找到电量文本: '{balance_text}'")
-                        balance_match = re.search(r'([\d.]+)', balance_text)
-                        if balance_match:
-                            balance = balance_match.group(1)
-                            logger.info(f"解析成功！剩余电量: {balance}度")
-                            return balance
-
-            # 方法2：提取input标签的left-degree属性
-            input_element = soup.find('input', {'id': 'roomdef'})
-            if input_element and input_element.get('left-degree'):
-                balance = input_element.get('left-degree')
-                logger.info(f"通过方法2找到电量: {balance}度")
-                return balance
-
-            # 方法3：通过CSS选择器直接定位
-            cells = soup.select('.weui-cell')
-            for cell in cells:
-                if '剩余电量' in cell.get_text():
-                    value_div = cell.select_one('div')
-                    if value_div:
-                        balance_text = value_div.get_text(strip=True)
-                        balance_match = re.search(r'([\d.]+)', balance_text)
-                        if balance_match:
-                            balance = balance_match.group(1)
-                            logger.info(f"通过方法3找到电量: {balance}度")
-                            return balance
-
-            logger.error("所有解析方法都失败")
-            return None
+            html = response.text
+            self.last_html = html
+            if self.conditional:
+                self._remember_page(response, html)
+            return html
 
         except Exception as e:
+            FETCH_SECONDS.observe(time.perf_counter() - started, breaker.name, 'error')
+            breaker.record_failure()
             logger.error(f"发生错误: {str(e)}")
             return None
 
-    def get_electricity_simple(self):
-        """简化版本，直接使用正则表达式从HTML文本提取"""
-        headers = {
-            'User-Agent': self.agent_and10
-        }
-
-        try:
-            response = requests.get(self.url, headers=headers, timeout=self.timeout)
-            response.encoding = self.html_encode
-
-            # 方法4：直接使用正则表达式搜索
-            left_degree_match = re.search(r'left-degree="([\d.]+)"', response.text)
-            if left_degree_match:
-                return left_degree_match.group(1)
-
-            # 方法5：搜索数字+度的模式
-            degree_match = re.search(r'(\d+\.?\d*)\s*度', response.text)
-            if degree_match:
-                return degree_match.group(1)
+    def _remember_page(self, response, html):
+        """记录响应的校验值和页面，页面内容未变化时保留上次的解析结果"""
+        with _page_cache_lock:
+            previous = _page_cache.get(self.url)
+            entry = {
+                'etag': response.headers.get('ETag'),
+                'last_modified': response.headers.get('Last-Modified'),
+                'html': html,
+                'balance': None,
+                'strategy': None
+            }
+            if previous and previous['html'] == html:
+                entry['balance'] = previous['balance']
+                entry['strategy'] = previous['strategy']
+            _page_cache[self.url] = entry
+
+    def _cached_result(self, html):
+        """页面与上次解析的页面相同时返回上次的 (balance, strategy)，否则返回None"""
+        cached = _page_cache.get(self.url)
+        if cached and cached['balance'] and cached['html'] == html:
+            return cached['balance'], cached['strategy']
+        return None
+
+    def parse_balance(self, html, strategies=None):
+        """
+        在同一份HTML上依次执行解析策略
+
+        Args:
+            html (str): 页面HTML
+            strategies (list): 要执行的策略名称，默认全部
+
+        Returns:
+            tuple: (balance, strategy)，全部失败时为 (None, None)
+        """
+        # BeautifulSoup解析树按需构建，且只构建一次
+        soup_cache = []
+        cpu_started = time.thread_time()
+
+        def get_soup():
+            if not soup_cache:
+                soup_cache.append(BeautifulSoup(html, 'html.parser'))
+            return soup_cache[0]
+
+        for name, method_name in self.PARSE_STRATEGIES:
+            if strategies is not None and name not in strategies:
+                continue
+            try:
+                balance = getattr(self, method_name)(html, get_soup)
+            except Exception as e:
+                logger.error(f"解析策略 {name} 出错: {e}")
+                continue
+            if balance:
+                logger.info(f"通过策略 {name} 找到电量: {balance}度")
+                PARSE_CPU_SECONDS.observe(time.thread_time() - cpu_started, name)
+                record_strategy_hit(name)
+                return balance, name
+
+        PARSE_CPU_SECONDS.observe(time.thread_time() - cpu_started, 'failed')
+        record_strategy_hit(None)
+        logger.error("所有解析方法都失败")
+        return None, None
+
+    @staticmethod
+    def _parse_weui_label(html, get_soup):
+        """方法1：直接提取包含电量的div文本"""
+        remaining_label = get_soup().find('label', class_='weui-label', string='剩余电量')
+        if remaining_label:
+            parent_div = remaining_label.find_parent('div', class_='weui-cell')
+            if parent_div:
+                value_div = parent_div.find('div')
+                if value_div and value_div.text.strip():
+                    balance_match = NUMBER_RE.search(value_div.text.strip())
+                    if balance_match:
+                        return balance_match.group(1)
+        return None
+
+    @staticmethod
+    def _parse_roomdef_attr(html, get_soup):
+        """方法2：提取input标签的left-degree属性"""
+        input_element = get_soup().find('input', {'id': 'roomdef'})
+        if input_element and input_element.get('left-degree'):
+            return input_element.get('left-degree')
+        return None
+
+    @staticmethod
+    def _parse_weui_cell_scan(html, get_soup):
+        """方法3：通过CSS选择器直接定位"""
+        for cell in get_soup().select('.weui-cell'):
+            if '剩余电量' in cell.get_text():
+                value_div = cell.select_one('div')
+                if value_div:
+                    balance_match = NUMBER_RE.search(value_div.get_text(strip=True))
+                    if balance_match:
+                        return balance_match.group(1)
+        return None
+
+    @staticmethod
+    def _parse_left_degree_regex(html, get_soup):
+        """方法4：直接使用正则表达式搜索left-degree属性"""
+        left_degree_match = LEFT_DEGREE_RE.search(html)
+        return left_degree_match.group(1) if left_degree_match else None
+
+    @staticmethod
+    def _parse_degree_regex(html, get_soup):
+        """方法5：搜索数字+度的模式"""
+        degree_match = DEGREE_RE.search(html)
+        return degree_match.group(1) if degree_match else None
+
+    @staticmethod
+    def _parse_weui_label_regex(html, get_soup):
+        """快速路径：用正则直接匹配"剩余电量"标签后的数值，不构建DOM"""
+        label_match = WEUI_LABEL_RE.search(html)
+        return label_match.group(1) if label_match else None
+
+    @staticmethod
+    def _parse_lxml_weui_cell(html, get_soup):
+        """快速路径：使用lxml定位包含"剩余电量"的weui-cell"""
+        tree = lxml.html.fromstring(html)
+        cells = tree.xpath("//div[contains(concat(' ', normalize-space(@class), ' '), ' weui-cell ')]"
+                           "[.//label[normalize-space()='剩余电量']]")
+        for cell in cells:
+            text = cell.text_content()
+            balance_match = NUMBER_RE.search(text[text.find('剩余电量') + len('剩余电量'):])
+            if balance_match:
+                return balance_match.group(1)
+        return None
 
+    def get_electricity_fixed(self):
+        """针对具体HTML结构优化的电费查询函数（方法1-3）"""
+        html = self.fetch_html()
+        if html is None:
             return None
+        return self.parse_balance(html, ('weui_label', 'roomdef_attr', 'weui_cell_scan'))[0]
 
-        except Exception as e:
-            logger.error(f"简化版本错误: {e}")
+    def get_electricity_simple(self):
+        """简化版本，直接使用正则表达式从HTML文本提取（方法4-5）"""
+        html = self.fetch_html(self.agent_and10)
+        if html is None:
             return None
+        return self.parse_balance(html, ('left_degree_regex', 'degree_regex'))[0]
 
     def query(self):
-        """执行电费查询"""
+        """执行电费查询，只请求一次页面，在同一响应上依次尝试所有解析策略"""
         logger.info("开始电费查询...")
         logger.info(f"使用URL: {self.url}")
 
-        # 先尝试完整解析
-        balance = self.get_electricity_fixed()
-
-        if not balance:
-            # 如果失败，尝试简化版本
-            logger.info("完整解析失败，尝试简化版本...")
-            balance = self.get_electricity_simple()
+        html = self.fetch_html()
+        if html is None:
+            self.last_strategy = None
+            return None
 
+        cached_result = self._cached_result(html) if self.conditional else None
+        if cached_result is not None:
+            if not self.not_modified:
+                _count_conditional('unchanged_body')
+            logger.info(f"页面未变化，沿用上次解析结果: {cached_result[0]}度")
+            balance, self.last_strategy = cached_result
+            return balance
+
+        balance, self.last_strategy = self.parse_balance(html)
+        if self.conditional and balance:
+            with _page_cache_lock:
+                cached = _page_cache.get(self.url)
+                if cached and cached['html'] is html:
+                    cached['balance'] = balance
+                    cached['strategy'] = self.last_strategy
         return balance
 
     def save_result(self, balance, output_file='electricity_result.txt'):
@@ -153,15 +447,18 @@ class ElectricityQuery:
             return False
 
     def save_debug_info(self, debug_file='debug_final.html'):
-        """保存调试信息"""
+        """保存调试信息，优先使用最近一次查询获取的页面"""
         try:
-            response = requests.get(
-                self.url,
-                headers={'User-Agent': self.agent_and10},
-                timeout=self.timeout
-            )
+            html = self.last_html
+            if html is None:
+                response = self.session.get(
+                    self.url,
+                    headers={'User-Agent': self.agent_and10},
+                    timeout=self.timeout
+                )
+                html = response.text
             with open(debug_file, 'w', encoding='utf-8') as f:
-                f.write(response.text)
+                f.write(html)
             logger.info(f"调试信息已保存到 {debug_file}")
             return True
         except Exception as e:
@@ -197,6 +494,8 @@ def main():
                         help='调试信息文件 (默认: debug_final.html)')
     parser.add_argument('--timeout', type=int, default=15,
                         help='请求超时时间(秒) (默认: 15)')
+    parser.add_argument('--base-url', type=str, default=None,
+                        help='替换查询URL的协议和主机，如 http://127.0.0.1:9000 (默认: 环境变量 ELECTRICITY_BASE_URL)')
 
     args = parser.parse_args()
 
@@ -207,7 +506,8 @@ def main():
         agent_wechat=args.agent_wechat,
         agent_and10=args.agent_and10,
         referer=args.referer,
-        timeout=args.timeout
+        timeout=args.timeout,
+        base_url=args.base_url
     )
 
     # 执行查询
@@ -0,0 +1,214 @@
+import logging
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+# 默认的耗时直方图桶上界(秒)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 进程内的指标注册表：名称 -> 指标；采集时回调的函数
+_metrics = {}
+_collectors = []
+_registry_lock = threading.Lock()
+
+
+def _format_labels(labelnames, values, extra=()):
+    """生成 {a="x",b="y"} 形式的标签，值中的反斜杠、引号和换行需要转义"""
+    pairs = list(zip(labelnames, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+               for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+
+def _format_value(value):
+    """数值格式化，整数不带小数点"""
+    if isinstance(value, float):
+        if math.isinf(value):
+            return '+Inf' if value > 0 else '-Inf'
+        if value.is_integer():
+            return str(int(value))
+    return str(value)
+
+
+class Counter:
+    """只增不减的计数器"""
+
+    type_name = 'counter'
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # 标签值元组 -> 计数
+        self._lock = threading.Lock()
+
+    def inc(self, *label_values, amount=1):
+        """按标签值累加"""
+        with self._lock:
+            self._values[label_values] = self._values.get(label_values, 0) + amount
+
+    def get(self, *label_values):
+        """当前计数"""
+        with self._lock:
+            return self._values.get(label_values, 0)
+
+    def items(self):
+        """所有标签组合及计数"""
+        with self._lock:
+            return list(self._values.items())
+
+    def samples(self):
+        """[(样本名, 标签字典, 值), ...]"""
+        return [(self.name, dict(zip(self.labelnames, labels)), value) for labels, value in self.items()]
+
+
+class Histogram:
+    """累计分桶直方图，同时记录总和与样本数"""
+
+    type_name = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}  # 标签值元组 -> [各桶计数(不累计), 总和, 样本数]
+        self._lock = threading.Lock()
+
+    def observe(self, value, *label_values):
+        """记录一个样本"""
+        index = 0
+        while index < len(self.buckets) and value > self.buckets[index]:
+            index += 1
+        with self._lock:
+            state = self._values.get(label_values)
+            if state is None:
+                state = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._values[label_values] = state
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+
+    @contextmanager
+    def time(self, *label_values):
+        """记录代码块的耗时"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *label_values)
+
+    def snapshot(self):
+        """
+        各标签组合的直方图
+
+        Returns:
+            dict: 标签值元组 -> {'buckets': [(上界, 累计计数), ...], 'sum', 'count'}
+        """
+        with self._lock:
+            values = {labels: (list(state[0]), state[1], state[2]) for labels, state in self._values.items()}
+        result = {}
+        for labels, (counts, total, count) in values.items():
+            cumulative, buckets = 0, []
+            for bound, bucket_count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += bucket_count
+                buckets.append((bound, cumulative))
+            result[labels] = {'buckets': buckets, 'sum': total, 'count': count}
+        return result
+
+    def samples(self):
+        """[(样本名, 标签字典, 值), ...]，每个标签组合输出各桶、总和与样本数"""
+        result = []
+        for labels, state in self.snapshot().items():
+            label_dict = dict(zip(self.labelnames, labels))
+            for bound, cumulative in state['buckets']:
+                result.append((f'{self.name}_bucket', dict(label_dict, le=_format_value(float(bound))), cumulative))
+            result.append((f'{self.name}_sum', label_dict, round(state['sum'], 6)))
+            result.append((f'{self.name}_count', label_dict, state['count']))
+        return result
+
+
+def _register(metric_class, name, *args, **kwargs):
+    """注册指标，同名指标已存在时直接返回（模块重复导入时不重复注册）"""
+    with _registry_lock:
+        metric = _metrics.get(name)
+        if metric is None:
+            metric = metric_class(name, *args, **kwargs)
+            _metrics[name] = metric
+        return metric
+
+
+def counter(name, documentation, labelnames=()):
+    """获取或创建计数器"""
+    return _register(Counter, name, documentation, labelnames)
+
+
+def histogram(name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+    """获取或创建直方图"""
+    return _register(Histogram, name, documentation, labelnames, buckets=buckets)
+
+
+def register_collector(collector):
+    """
+    注册采集回调，在每次输出指标时调用，用于队列深度、熔断状态等现成的状态
+
+    collector() 返回 [(name, type, documentation, [(labels_dict, value), ...]), ...]
+    """
+    with _registry_lock:
+        _collectors.append(collector)
+
+
+def collect():
+    """
+    本进程所有指标的当前值，结果可JSON序列化，供多进程部署时合并输出
+
+    Returns:
+        list: [(name, type, documentation, [(样本名, 标签字典, 值), ...]), ...]
+    """
+    with _registry_lock:
+        metrics = list(_metrics.values())
+        collectors = list(_collectors)
+
+    families = [(metric.name, metric.type_name, metric.documentation, metric.samples()) for metric in metrics]
+    for collector in collectors:
+        try:
+            collected = collector()
+        except Exception as e:
+            logger.error(f"指标采集回调执行失败: {e}")
+            continue
+        for name, type_name, documentation, samples in collected:
+            families.append((name, type_name, documentation,
+                             [(name, labels, value) for labels, value in samples]))
+    return families
+
+
+def render(sources=None):
+    """
+    按Prometheus文本格式输出指标
+
+    Args:
+        sources (list): [(额外标签字典, collect() 的结果), ...]，同名指标合并输出；默认只输出本进程的指标
+    """
+    if sources is None:
+        sources = [({}, collect())]
+
+    merged = {}  # name -> [type, documentation, 样本行]
+    for extra, families in sources:
+        for name, type_name, documentation, samples in families:
+            family = merged.setdefault(name, [type_name, documentation, []])
+            for sample_name, labels, value in samples:
+                labels = dict(labels, **extra)
+                family[2].append(f'{sample_name}{_format_labels(tuple(labels), tuple(labels.values()))} '
+                                 f'{_format_value(value)}')
+
+    lines = []
+    for name, (type_name, documentation, sample_lines) in merged.items():
+        lines.append(f'# HELP {name} {documentation}')
+        lines.append(f'# TYPE {name} {type_name}')
+        lines.extend(sample_lines)
+    return '\n'.join(lines) + '\n'
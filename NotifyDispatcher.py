@@ -0,0 +1,198 @@
+import itertools
+import logging
+import queue
+import threading
+import time
+from collections import deque
+
+from Pushplus import get_notifier, OUTCOME_SUCCESS, OUTCOME_RETRY
+
+logger = logging.getLogger(__name__)
+
+# 默认参数值
+DEFAULT_WORKERS = 4  # 并行投递的工作线程数
+DEFAULT_MAX_RETRIES = 3  # 单个渠道连接失败或服务器5xx后的最大重试次数
+DEFAULT_BACKOFF_BASE = 2.0  # 重试退避基数(秒)，第n次重试等待 base * 2^(n-1)
+DEFAULT_MAX_QUEUE = 1000  # 队列最大长度，超出时丢弃新消息
+LATENCY_WINDOW = 200  # 统计投递延迟时保留的最近样本数
+
+
+class NotifyJob:
+    """单个渠道的一次推送任务"""
+
+    __slots__ = ('job_id', 'token', 'channel', 'topic', 'title', 'content',
+                 'attempts', 'enqueued_at', 'callback')
+
+    def __init__(self, job_id, token, channel, topic, title, content, callback=None):
+        self.job_id = job_id
+        self.token = token
+        self.channel = channel
+        self.topic = topic
+        self.title = title
+        self.content = content
+        self.attempts = 0
+        self.enqueued_at = time.monotonic()
+        self.callback = callback  # 投递结束后回调 callback(job, success)
+
+
+class NotifyDispatcher:
+    """推送分发类 - 后台线程并行投递各渠道，失败时指数退避重试"""
+
+    def __init__(self, workers=DEFAULT_WORKERS, max_retries=DEFAULT_MAX_RETRIES,
+                 backoff_base=DEFAULT_BACKOFF_BASE, max_queue=DEFAULT_MAX_QUEUE):
+        self.workers = workers
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._threads = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+        self._retry_timers = set()
+        self._in_flight = 0
+        self._delivered = 0
+        self._failed = 0
+        self._retried = 0
+        self._dropped = 0
+        self._latencies = deque(maxlen=LATENCY_WINDOW)  # 入队到投递完成的耗时(秒)
+
+    def start(self):
+        """启动工作线程，重复调用无副作用"""
+        with self._lock:
+            if self._threads:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f'notify-dispatcher-{index}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+        logger.info(f"推送分发线程已启动: {self.workers}个")
+
+    def submit(self, token, channels, topic, title, content, callback=None, channel_content=None):
+        """
+        将消息按渠道拆分后加入队列，立即返回
+
+        Args:
+            channel_content (dict): 个别渠道使用的替代内容，如短信使用纯文本
+
+        Returns:
+            int: 成功入队的渠道数
+        """
+        self.start()
+        queued = 0
+        for channel in channels:
+            job_content = (channel_content or {}).get(channel, content)
+            job = NotifyJob(next(self._ids), token, channel, topic, title, job_content, callback)
+            if self._put(job):
+                queued += 1
+        return queued
+
+    def _put(self, job):
+        """入队，队列已满时丢弃并记录"""
+        try:
+            self._queue.put_nowait(job)
+            return True
+        except queue.Full:
+            with self._lock:
+                self._dropped += 1
+            logger.error(f"推送队列已满，丢弃消息: 渠道={job.channel}, 标题={job.title}")
+            return False
+
+    def _schedule_retry(self, job):
+        """延迟后重新入队，等待期间不占用工作线程"""
+        delay = self.backoff_base * (2 ** (job.attempts - 1))
+        logger.info(f"渠道 {job.channel} 推送失败，{delay:.0f}秒后第{job.attempts}次重试")
+
+        def requeue():
+            with self._lock:
+                self._retry_timers.discard(timer)
+            self._put(job)
+
+        timer = threading.Timer(delay, requeue)
+        timer.daemon = True
+        with self._lock:
+            self._retried += 1
+            self._retry_timers.add(timer)
+        timer.start()
+
+    def _deliver(self, job):
+        """实际调用PushPlus发送，复用缓存的推送实例，返回 OUTCOME_*"""
+        notifier = get_notifier(job.token, job.channel, job.topic)
+        return notifier.send(job.title, job.content)
+
+    def _worker(self):
+        """工作线程主循环"""
+        while True:
+            job = self._queue.get()
+            if job is None:
+                self._queue.task_done()
+                return
+
+            with self._lock:
+                self._in_flight += 1
+            try:
+                job.attempts += 1
+                try:
+                    outcome = self._deliver(job)
+                except Exception as e:
+                    logger.error(f"向渠道 {job.channel} 发送通知异常: {str(e)}")
+                    outcome = None
+                success = outcome == OUTCOME_SUCCESS
+
+                # 只重试未送达的请求；读取超时和业务错误重试可能重复发送（短信计费）或必然再次失败
+                if outcome == OUTCOME_RETRY and job.attempts <= self.max_retries:
+                    self._schedule_retry(job)
+                    continue
+
+                with self._lock:
+                    if success:
+                        self._delivered += 1
+                        self._latencies.append(time.monotonic() - job.enqueued_at)
+                    else:
+                        self._failed += 1
+
+                if success:
+                    logger.info(f"向渠道 {job.channel} 发送通知成功")
+                else:
+                    logger.error(f"向渠道 {job.channel} 发送通知失败，已重试{job.attempts - 1}次")
+
+                if job.callback:
+                    try:
+                        job.callback(job, success)
+                    except Exception as e:
+                        logger.error(f"推送回调执行失败: {e}")
+            finally:
+                with self._lock:
+                    self._in_flight -= 1
+                self._queue.task_done()
+
+    def status(self):
+        """队列深度、投递结果和延迟统计"""
+        with self._lock:
+            latencies = sorted(self._latencies)
+            return {
+                'queue_depth': self._queue.qsize(),
+                'in_flight': self._in_flight,
+                'pending_retries': len(self._retry_timers),
+                'delivered': self._delivered,
+                'failed': self._failed,
+                'retried': self._retried,
+                'dropped': self._dropped,
+                'workers': len(self._threads),
+                'latency_p50': round(latencies[len(latencies) // 2], 3) if latencies else None,
+                'latency_p95': round(latencies[int(len(latencies) * 0.95)], 3) if latencies else None,
+                'latency_max': round(latencies[-1], 3) if latencies else None
+            }
+
+    def shutdown(self, timeout=10):
+        """等待队列中已有的消息投递完成后停止工作线程"""
+        with self._lock:
+            threads = list(self._threads)
+            self._threads.clear()
+        for _ in threads:
+            try:
+                self._queue.put(None, timeout=timeout)
+            except queue.Full:
+                logger.error("推送队列已满，无法通知工作线程退出")
+                break
+        deadline = time.monotonic() + timeout
+        for thread in threads:
+            thread.join(max(0, deadline - time.monotonic()))
@@ -0,0 +1,123 @@
+import logging
+import random
+import threading
+import time
+import zlib
+
+logger = logging.getLogger(__name__)
+
+# 默认参数值
+DEFAULT_JITTER = 0.1  # 每次查询间隔的随机抖动比例(±)
+MIN_FACTOR = 0.25  # 临近阈值或快速下降时，间隔最短缩到基础间隔的 1/4
+MAX_FACTOR = 4.0  # 电量充足且稳定时，间隔最长放大到基础间隔的 4 倍
+MIN_INTERVAL_SECONDS = 60  # 单个房间的最短查询间隔
+
+
+class PollPlanner:
+    """分散+自适应的查询计划类 - 各房间均匀错开查询时间，并按电量状况调整频率"""
+
+    def __init__(self, jitter=DEFAULT_JITTER):
+        self.jitter = jitter
+        self.base_seconds = None  # 最近一次整体分布时使用的基础间隔
+        self._next_due = {}  # url -> 下次查询的单调时钟时间
+        self._intervals = {}  # url -> 当前使用的查询间隔(秒)
+        self._lock = threading.Lock()
+
+    def _initial_offset(self, url, base_seconds):
+        """新加入的房间按URL哈希放到基础间隔内的固定位置"""
+        slot = zlib.crc32(url.encode('utf-8')) / 0xFFFFFFFF
+        return slot * base_seconds
+
+    def _spread_evenly(self, urls, base_seconds, now):
+        """把一组房间等距分布在一个基础间隔内，各自在所属时间槽内抖动"""
+        count = len(urls)
+        for index, url in enumerate(sorted(urls)):
+            offset = base_seconds * (index + random.uniform(0, self.jitter)) / count
+            self._next_due[url] = now + offset
+            self._intervals[url] = base_seconds
+
+    def _jittered(self, seconds):
+        """加入随机抖动"""
+        return seconds * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def due_rooms(self, urls, base_seconds, now=None):
+        """
+        获取当前需要查询的房间
+
+        Args:
+            urls (list): 所有已登记的房间URL
+            base_seconds (float): 基础查询间隔(秒)
+            now (float): 当前单调时钟时间，默认 time.monotonic()
+
+        Returns:
+            list: 已到期的房间URL
+        """
+        now = time.monotonic() if now is None else now
+        due = []
+        with self._lock:
+            # 移除已不再登记的房间
+            for url in set(self._next_due) - set(urls):
+                self._next_due.pop(url, None)
+                self._intervals.pop(url, None)
+
+            # 首次运行时所有房间等距错开
+            if not self._next_due and urls:
+                self.base_seconds = base_seconds
+                self._spread_evenly(urls, base_seconds, now)
+
+            for url in urls:
+                next_due = self._next_due.get(url)
+                if next_due is None:
+                    # 新房间：放到基础间隔内的固定位置
+                    self._next_due[url] = now + self._initial_offset(url, base_seconds)
+                    self._intervals[url] = base_seconds
+                    continue
+                if next_due <= now:
+                    due.append(url)
+        return due
+
+    def adaptive_factor(self, balance, threshold, hours_to_empty=None, forecast_hours=0):
+        """
+        根据电量状况计算间隔倍数
+
+        电量接近阈值或预计很快用完时加快查询，电量充足且用电平稳时放慢查询
+        """
+        if balance is None:
+            return 1.0
+        balance = float(balance)
+        if threshold and balance < threshold * 1.5:
+            return MIN_FACTOR
+        if forecast_hours and hours_to_empty is not None and hours_to_empty < forecast_hours * 2:
+            return MIN_FACTOR * 2
+        if threshold and balance > threshold * 4 and (hours_to_empty is None or hours_to_empty > 24 * 7):
+            return MAX_FACTOR
+        if threshold and balance > threshold * 2:
+            return 2.0
+        return 1.0
+
+    def record(self, url, base_seconds, factor=1.0, now=None):
+        """记录一次查询并安排下一次查询时间"""
+        now = time.monotonic() if now is None else now
+        interval = max(MIN_INTERVAL_SECONDS, base_seconds * factor)
+        with self._lock:
+            self._intervals[url] = interval
+            self._next_due[url] = now + self._jittered(interval)
+
+    def reschedule(self, base_seconds, now=None):
+        """基础间隔变化后重新等距分布所有房间"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            self.base_seconds = base_seconds
+            self._spread_evenly(list(self._next_due), base_seconds, now)
+
+    def snapshot(self, now=None):
+        """各房间的当前查询间隔和距下次查询的秒数"""
+        now = time.monotonic() if now is None else now
+        with self._lock:
+            return {
+                url: {
+                    'interval': round(self._intervals.get(url, 0)),
+                    'next_in': max(0, round(next_due - now))
+                }
+                for url, next_due in self._next_due.items()
+            }
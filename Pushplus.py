@@ -4,26 +4,113 @@ import json
 import requests
 import argparse
 import logging
+import os
 import random
+import threading
+import time
+from requests.adapters import HTTPAdapter
+
+import Metrics
 
-import random
 # 配置日志
 logger = logging.getLogger(__name__)
 
 # 默认参数值
 DEFAULT_PUSHPULS_TOKEN = ''
 DEFAULT_CHANNEL = 'mail'
+# 可通过环境变量 PUSHPLUS_BASE_URL 指向本地测试服务器
+DEFAULT_BASE_URL = os.environ.get('PUSHPLUS_BASE_URL', 'https://www.pushplus.plus/send')
+DEFAULT_POOL_MAXSIZE = 8  # 与推送分发线程数匹配的长连接数
+LATENCY_BUCKETS = (0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # 推送耗时直方图的桶上界(秒)
+
+# 推送结果：成功；可重试（请求未送达服务器或服务器5xx）；失败（不可重试，重试可能重复发送或必然再次失败）
+OUTCOME_SUCCESS = 'success'
+OUTCOME_RETRY = 'retry'
+OUTCOME_FAILED = 'failed'
+
+# 所有推送实例共享的长连接会话
+_shared_session = None
+_session_lock = threading.Lock()
+
+# 按 (token, channel, topic) 缓存的推送实例
+_notifiers = {}
+_notifiers_lock = threading.Lock()
+
+# 按渠道统计的推送耗时直方图和推送结果
+DELIVERY_SECONDS = Metrics.histogram('pushplus_delivery_seconds', 'PushPlus推送耗时(秒)', ('channel',),
+                                     buckets=LATENCY_BUCKETS)
+DELIVERY_TOTAL = Metrics.counter('pushplus_delivery_total', 'PushPlus推送次数', ('channel', 'outcome'))
+
+
+def get_shared_session():
+    """获取共享会话，首次调用时创建"""
+    global _shared_session
+    if _shared_session is None:
+        with _session_lock:
+            if _shared_session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=2, pool_maxsize=DEFAULT_POOL_MAXSIZE)
+                session.mount('http://', adapter)
+                session.mount('https://', adapter)
+                _shared_session = session
+    return _shared_session
+
+
+def get_notifier(token=DEFAULT_PUSHPULS_TOKEN, channel=DEFAULT_CHANNEL, topic=''):
+    """获取缓存的推送实例，同一 (token, channel, topic) 复用同一个实例"""
+    key = (token, channel, topic)
+    notifier = _notifiers.get(key)
+    if notifier is None:
+        with _notifiers_lock:
+            notifier = _notifiers.get(key)
+            if notifier is None:
+                notifier = PushPlusNotifier(token=token, channel=channel, topic=topic)
+                _notifiers[key] = notifier
+    return notifier
+
+
+def record_latency(channel, seconds, success):
+    """记录一次推送耗时和结果"""
+    DELIVERY_SECONDS.observe(seconds, channel)
+    DELIVERY_TOTAL.inc(channel, 'success' if success else 'failure')
+
+
+def get_latency_stats():
+    """按渠道获取推送耗时直方图，buckets 为累计计数，键为桶上界"""
+    result = {}
+    for (channel,), stats in DELIVERY_SECONDS.snapshot().items():
+        result[channel] = {
+            'buckets': {'+Inf' if bound == float('inf') else str(bound): cumulative
+                        for bound, cumulative in stats['buckets']},
+            'count': stats['count'],
+            'sum': round(stats['sum'], 4),
+            'success': DELIVERY_TOTAL.get(channel, 'success'),
+            'failure': DELIVERY_TOTAL.get(channel, 'failure')
+        }
+    return result
 
 
 class PushPlusNotifier:
     """PushPlus消息推送类 - 支持群组推送"""
 
-    def __init__(self, token=DEFAULT_PUSHPULS_TOKEN, channel=DEFAULT_CHANNEL, topic=''):
+    def __init__(self, token=DEFAULT_PUSHPULS_TOKEN, channel=DEFAULT_CHANNEL, topic='', session=None,
+                 base_url=None):
         self.token = token
         self.channel = channel
         self.topic = topic  # 群组编码/话题编码
-        self.base_url = 'https://www.pushplus.plus/send'
+        self.base_url = base_url or DEFAULT_BASE_URL
         self.last_content_hash = None
+        # 未传入会话时使用共享的长连接会话
+        self.session = session or get_shared_session()
+        self.headers = {'Content-Type': 'application/json'}
+        # 每次推送不变的字段只构建一次
+        self.base_payload = {
+            "token": self.token,
+            "template": "html",
+            "channel": self.channel
+        }
+        if self.topic:
+            self.base_payload["topic"] = self.topic  # 群组/话题编码
 
     def generate_variation_content(self, base_content):
         """生成有变化的推送内容，避免重复检测"""
@@ -51,59 +138,80 @@ class PushPlusNotifier:
         return varied_content
 
     def pushplus_notify(self, title, content):
-        """发送PushPlus通知，支持群组推送"""
+        """发送PushPlus通知，支持群组推送，返回是否成功"""
+        return self.send(title, content) == OUTCOME_SUCCESS
+
+    def _post(self, data):
+        """
+        发送一次请求并判断结果
+
+        读取超时时服务器可能已经受理（短信按条计费），与 token 错误等业务错误一样不可重试；
+        只有连接失败（请求未送达）和服务器5xx可以重试
+
+        Returns:
+            tuple: (结果, 业务错误信息)
+        """
+        try:
+            response = self.session.post(self.base_url, json=data, headers=self.headers, timeout=10)
+        except requests.exceptions.ConnectionError as e:
+            logger.error(f"推送连接失败: {str(e)}")
+            return OUTCOME_RETRY, None
+        except requests.exceptions.RequestException as e:
+            logger.error(f"推送请求超时或出错，不重试以免重复发送: {str(e)}")
+            return OUTCOME_FAILED, None
+
+        if response.status_code >= 500:
+            logger.error(f"推送失败，HTTP状态码: {response.status_code}")
+            return OUTCOME_RETRY, None
+        if response.status_code != 200:
+            logger.error(f"推送失败，HTTP状态码: {response.status_code}")
+            return OUTCOME_FAILED, None
+
+        response_data = response.json()
+        if response_data.get('code') == 200:
+            return OUTCOME_SUCCESS, None
+        error_msg = response_data.get('msg', '未知错误')
+        logger.error(f"推送失败: {error_msg}")
+        return OUTCOME_FAILED, error_msg
+
+    def send(self, title, content):
+        """
+        发送PushPlus通知，支持群组推送
+
+        Returns:
+            str: OUTCOME_SUCCESS / OUTCOME_RETRY / OUTCOME_FAILED
+        """
         today = datetime.now().strftime('%Y-%m-%d')
         full_title = f"{title} {today}"
         varied_content = self.generate_variation_content(content)
 
-        # 基础数据
-        data = {
-            "token": self.token,
-            "title": full_title,
-            "content": varied_content,
-            "template": "html",
-            "channel": self.channel
-        }
-
-        # 添加群组推送参数
+        # 基础数据 + 本次的标题和内容
+        data = dict(self.base_payload, title=full_title, content=varied_content)
         if self.topic:
-            data["topic"] = self.topic  # 群组/话题编码
             logger.info(f"启用群组推送，群组编码: {self.topic}")
 
+        started = time.perf_counter()
+        outcome = OUTCOME_FAILED
         try:
             logger.info(f"开始推送消息: 渠道={self.channel}, 群组={self.topic or '个人'}, token={self.token[:8]}...")
 
-            headers = {'Content-Type': 'application/json'}
-            response = requests.post(self.base_url, json=data, headers=headers, timeout=10)
-
-            if response.status_code == 200:
-                response_data = response.json()
-                if response_data.get('code') == 200:
-                    logger.info("推送成功")
-                    return True
-                else:
-                    error_msg = response_data.get('msg', '未知错误')
-                    logger.error(f"推送失败: {error_msg}")
-                    
-                    # 如果是topic错误，尝试不使用topic发送
-                    if "topic" in error_msg.lower():
-                        logger.info("尝试不使用群组编码发送...")
-                        data.pop("topic", None)
-                        response = requests.post(self.base_url, json=data, headers=headers, timeout=10)
-                        if response.status_code == 200:
-                            response_data = response.json()
-                            if response_data.get('code') == 200:
-                                logger.info("个人推送成功")
-                                return True
-                    
-                    return False
-            else:
-                logger.error(f"推送失败，HTTP状态码: {response.status_code}")
-                return False
+            outcome, error_msg = self._post(data)
+            if outcome == OUTCOME_SUCCESS:
+                logger.info("推送成功")
+            elif error_msg and "topic" in error_msg.lower():
+                # 如果是topic错误，尝试不使用topic发送
+                logger.info("尝试不使用群组编码发送...")
+                data.pop("topic", None)
+                outcome, _ = self._post(data)
+                if outcome == OUTCOME_SUCCESS:
+                    logger.info("个人推送成功")
+            return outcome
 
         except Exception as e:
             logger.error(f"推送过程中出错: {str(e)}")
-            return False
+            return OUTCOME_FAILED
+        finally:
+            record_latency(self.channel, time.perf_counter() - started, outcome == OUTCOME_SUCCESS)
 
 
 # 便捷函数，保持向后兼容
@@ -117,7 +225,7 @@ def pushplus_notify(title, content, token=DEFAULT_PUSHPULS_TOKEN, channel=DEFAUL
         token (str): PushPlus token，默认为预定义值
         channel (str): 推送渠道，默认为'mail'
     """
-    notifier = PushPlusNotifier(token, channel)
+    notifier = get_notifier(token, channel)
     return notifier.pushplus_notify(title, content)
 
 
@@ -0,0 +1,254 @@
+import argparse
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+
+import Metrics
+from Database import get_db
+from SampleStore import BALANCE_SCALE, to_ts, from_ts
+
+logger = logging.getLogger(__name__)
+
+# 默认参数值
+DEFAULT_RAW_DAYS = 90  # 原始样本保留天数
+DEFAULT_HOURLY_MONTHS = 12  # 小时汇总保留月数（按30天计），按天汇总永久保留
+DEFAULT_BATCH_HOURS = 24  # 每批压缩单个房间多少小时的原始样本
+DEFAULT_TIME_BUDGET = 20.0  # 单次压缩任务的最长运行时间(秒)，未完成的部分下次继续
+DEFAULT_VACUUM_PAGES = 2000  # 每次增量回收的最大页数
+
+# 把一个房间一段整点时间窗内的原始样本汇总为小时数据，窗口第一个样本与上一小时的收盘电量比较；
+# 时间窗按整点对齐，正常情况下不会与已有小时数据冲突，冲突时合并
+HOURLY_COMPACT_SQL = f'''INSERT INTO electricity_hourly
+                        (room_identifier, hour, open_balance, close_balance, min_balance, max_balance,
+                         consumption, sample_count)
+                        WITH window_rows AS (
+                            SELECT ts, balance * 1.0 / {BALANCE_SCALE} AS balance,
+                                   strftime('%Y-%m-%d %H:00:00', ts, 'unixepoch', 'localtime') AS hour
+                            FROM samples
+                            WHERE room_key = ? AND ts >= ? AND ts < ?),
+                        hourly AS (
+                            SELECT hour, ts, balance,
+                                   LAG(balance, 1, ?) OVER (ORDER BY ts) AS prev_balance,
+                                   ROW_NUMBER() OVER (PARTITION BY hour ORDER BY ts) AS rn_first,
+                                   ROW_NUMBER() OVER (PARTITION BY hour ORDER BY ts DESC) AS rn_last
+                            FROM window_rows)
+                        SELECT ?, hour,
+                               MAX(CASE WHEN rn_first = 1 THEN balance END),
+                               MAX(CASE WHEN rn_last = 1 THEN balance END),
+                               MIN(balance), MAX(balance),
+                               SUM(MAX(COALESCE(prev_balance - balance, 0), 0)),
+                               COUNT(*)
+                        FROM hourly WHERE true GROUP BY hour
+                        ON CONFLICT (room_identifier, hour) DO UPDATE SET
+                            close_balance = excluded.close_balance,
+                            min_balance = MIN(min_balance, excluded.min_balance),
+                            max_balance = MAX(max_balance, excluded.max_balance),
+                            consumption = consumption + excluded.consumption,
+                            sample_count = sample_count + excluded.sample_count'''
+
+ROWS_COMPACTED = Metrics.counter('retention_rows_compacted_total', '汇总为小时数据后删除的原始样本数')
+ROWS_EXPIRED = Metrics.counter('retention_rows_expired_total', '超过保留期删除的行数', ('table',))
+
+
+def hour_floor(moment):
+    """向下取整到整点"""
+    return moment.replace(minute=0, second=0, microsecond=0)
+
+
+class RetentionManager:
+    """分级保留类 - 原始样本保留N天，之后汇总为小时数据保留M个月，按天汇总永久保留
+
+    压缩和删除按房间、按时间窗分小批执行，每批一个事务，不会长时间占用写锁；
+    数据库开启增量回收时，删除后回收空闲页，数据库文件大小保持稳定。
+    旧数据库需先停止服务后执行一次 `python Retention.py --enable-incremental-vacuum` 开启
+    """
+
+    def __init__(self, store, batch_hours=DEFAULT_BATCH_HOURS, time_budget=DEFAULT_TIME_BUDGET,
+                 vacuum_pages=DEFAULT_VACUUM_PAGES):
+        """
+        Args:
+            store (SampleStore): 样本存储，提供房间字典和旧表迁移状态
+        """
+        self.store = store
+        self.batch_hours = batch_hours
+        self.time_budget = time_budget
+        self.vacuum_pages = vacuum_pages
+        self._lock = threading.Lock()  # 同一进程内只运行一个压缩任务
+        self._last_run = None
+
+    @staticmethod
+    def init_table(conn):
+        """创建小时汇总表"""
+        conn.execute('''CREATE TABLE IF NOT EXISTS electricity_hourly
+                        (room_identifier TEXT NOT NULL,
+                         hour TEXT NOT NULL,  -- 整点时间 YYYY-MM-DD HH:00:00
+                         open_balance REAL,
+                         close_balance REAL,
+                         min_balance REAL,
+                         max_balance REAL,
+                         consumption REAL,  -- 该小时用电量，不含充值带来的增加
+                         sample_count INTEGER,
+                         PRIMARY KEY (room_identifier, hour))''')
+
+    @staticmethod
+    def raw_cutoff(raw_days, now=None):
+        """原始样本的保留起点（整点），早于该时间的样本由小时数据代替；raw_days 为0时返回None"""
+        if not raw_days:
+            return None
+        return hour_floor((now or datetime.now()) - timedelta(days=raw_days))
+
+    def run(self, raw_days=DEFAULT_RAW_DAYS, hourly_months=DEFAULT_HOURLY_MONTHS):
+        """
+        执行一次压缩：汇总并删除过期原始样本、删除过期小时数据、增量回收空间
+
+        Args:
+            raw_days (int): 原始样本保留天数，0 表示永久保留
+            hourly_months (int): 小时汇总保留月数，0 表示永久保留
+
+        Returns:
+            dict: 本次运行的统计
+        """
+        if not self._lock.acquire(blocking=False):
+            logger.info("数据压缩任务正在运行，跳过本次执行")
+            return None
+        try:
+            started = time.monotonic()
+            deadline = started + self.time_budget
+            stats = {'compacted': 0, 'hourly_rows': 0, 'expired_hourly': 0, 'vacuumed_pages': 0, 'finished': True}
+            conn = get_db()
+
+            cutoff = self.raw_cutoff(raw_days)
+            if cutoff is not None and self.store.migration_pending():
+                # 旧表迁移完成前不压缩，避免稍后迁入的旧样本落在已压缩的时间段
+                stats['finished'] = False
+            elif cutoff is not None:
+                stats['finished'] = self._compact_raw(conn, cutoff, deadline, stats)
+            if hourly_months and time.monotonic() < deadline:
+                stats['expired_hourly'] = self._expire_hourly(conn, datetime.now() - timedelta(days=30 * hourly_months))
+
+            stats['vacuumed_pages'] = self._incremental_vacuum(conn)
+            stats['seconds'] = round(time.monotonic() - started, 2)
+            stats['finished_at'] = datetime.now().isoformat()
+            self._last_run = stats
+            if stats['compacted'] or stats['expired_hourly']:
+                logger.info(f"数据压缩完成: {stats}")
+            return stats
+        finally:
+            self._lock.release()
+
+    def _compact_raw(self, conn, cutoff, deadline, stats):
+        """按房间轮流压缩早于 cutoff 的原始样本，返回是否已全部完成"""
+        pending = self.store.rooms()
+        while pending:
+            for room in list(pending):
+                if time.monotonic() >= deadline:
+                    return False
+                if not self._compact_room_batch(conn, room, cutoff, stats):
+                    pending.remove(room)
+        return True
+
+    def _compact_room_batch(self, conn, room, cutoff, stats):
+        """压缩单个房间最早的一个时间窗，返回是否还有待压缩的样本"""
+        room_key, room_identifier = room
+        row = conn.execute("SELECT MIN(ts) FROM samples WHERE room_key = ? AND ts < ?",
+                           (room_key, to_ts(cutoff))).fetchone()
+        if row is None or row[0] is None:
+            return False
+
+        window_start = hour_floor(from_ts(row[0]))
+        window_end = min(cutoff, window_start + timedelta(hours=self.batch_hours))
+        previous = conn.execute('''SELECT close_balance FROM electricity_hourly
+                                   WHERE room_identifier = ? AND hour < ?
+                                   ORDER BY hour DESC LIMIT 1''',
+                                (room_identifier, str(window_start))).fetchone()
+        with conn:
+            hourly_rows = conn.execute(HOURLY_COMPACT_SQL,
+                                       (room_key, to_ts(window_start), to_ts(window_end),
+                                        previous[0] if previous else None, room_identifier)).rowcount
+            deleted = conn.execute("DELETE FROM samples WHERE room_key = ? AND ts >= ? AND ts < ?",
+                                   (room_key, to_ts(window_start), to_ts(window_end))).rowcount
+        stats['compacted'] += deleted
+        stats['hourly_rows'] += hourly_rows
+        ROWS_COMPACTED.inc(amount=deleted)
+        return window_end < cutoff
+
+    def _expire_hourly(self, conn, before):
+        """按房间删除过期的小时数据，每个房间一个事务"""
+        expired = 0
+        before_hour = str(hour_floor(before))
+        for _, room_identifier in self.store.rooms():
+            with conn:
+                expired += conn.execute("DELETE FROM electricity_hourly WHERE room_identifier = ? AND hour < ?",
+                                        (room_identifier, before_hour)).rowcount
+        ROWS_EXPIRED.inc('electricity_hourly', amount=expired)
+        return expired
+
+    @staticmethod
+    def enable_incremental_vacuum(conn):
+        """执行一次完整VACUUM把旧数据库切换为增量回收模式；期间占用写锁，需在服务停止时执行
+
+        Returns:
+            bool: 是否执行了切换（已是增量回收模式时返回 False）
+        """
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2:
+            return False
+        conn.commit()
+        conn.execute("PRAGMA auto_vacuum = INCREMENTAL")
+        conn.execute("VACUUM")
+        return True
+
+    def _incremental_vacuum(self, conn):
+        """回收最多 vacuum_pages 个空闲页，返回回收的页数；未开启增量回收的旧数据库不回收"""
+        if conn.execute("PRAGMA auto_vacuum").fetchone()[0] != 2:
+            if self._last_run is None:
+                logger.warning("数据库未开启增量回收，删除的数据不会缩小文件；"
+                               "请在停止服务后执行 python Retention.py --enable-incremental-vacuum")
+            return 0
+        free_before = conn.execute("PRAGMA freelist_count").fetchone()[0]
+        if not free_before:
+            return 0
+        # execute() 只执行一步（回收一页），executescript() 会执行到完成
+        conn.commit()
+        conn.executescript(f"PRAGMA incremental_vacuum({int(self.vacuum_pages)})")
+        return free_before - conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+    def status(self):
+        """各表行数、数据库页数和最近一次运行的统计"""
+        conn = get_db()
+        page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+        return {
+            'raw_rows': conn.execute("SELECT COUNT(*) FROM samples").fetchone()[0],
+            'hourly_rows': conn.execute("SELECT COUNT(*) FROM electricity_hourly").fetchone()[0],
+            'daily_rows': conn.execute("SELECT COUNT(*) FROM electricity_daily").fetchone()[0],
+            'db_bytes': conn.execute("PRAGMA page_count").fetchone()[0] * page_size,
+            'free_bytes': conn.execute("PRAGMA freelist_count").fetchone()[0] * page_size,
+            'incremental_vacuum': conn.execute("PRAGMA auto_vacuum").fetchone()[0] == 2,
+            'last_run': self._last_run
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='数据库维护')
+    parser.add_argument('--db', default=None, help='数据库文件 (默认: 应用使用的数据库)')
+    parser.add_argument('--enable-incremental-vacuum', action='store_true',
+                        help='执行一次完整VACUUM切换为增量回收模式，请先停止服务')
+    args = parser.parse_args()
+    if not args.enable_incremental_vacuum:
+        parser.print_help()
+        return
+
+    import Database
+    if args.db:
+        Database.db_manager.db_path = args.db
+    logging.basicConfig(level=logging.INFO)
+    started = time.monotonic()
+    if RetentionManager.enable_incremental_vacuum(get_db()):
+        logger.info(f"已切换为增量回收模式，耗时 {time.monotonic() - started:.1f}s")
+    else:
+        logger.info("数据库已是增量回收模式")
+    Database.db_manager.close_all()
+
+
+if __name__ == '__main__':
+    main()
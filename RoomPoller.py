@@ -0,0 +1,108 @@
+import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from urllib.parse import urlparse
+
+from ElectricityQuery import ElectricityQuery, configure_shared_session
+
+logger = logging.getLogger(__name__)
+
+# 默认参数值
+DEFAULT_MAX_WORKERS = 16
+DEFAULT_PER_HOST_LIMIT = 4
+
+# 进程内按主机共享的并发信号量：主机 -> (并发上限, 信号量)；
+# 各轮查询、超过截止时间仍在运行的线程和手动测量共同计数
+_host_semaphores = {}
+_host_lock = threading.Lock()
+
+
+def get_host_semaphore(url, limit):
+    """获取主机的并发信号量；上限修改后换用新的信号量，持有旧信号量的请求结束后释放旧的"""
+    host = urlparse(url).netloc
+    with _host_lock:
+        entry = _host_semaphores.get(host)
+        if entry is None or entry[0] != limit:
+            entry = (limit, threading.BoundedSemaphore(limit))
+            _host_semaphores[host] = entry
+        return entry[1]
+
+
+class RoomPoller:
+    """多房间并发查询类 - 有界线程池 + 按主机限制并发"""
+
+    def __init__(self, max_workers=DEFAULT_MAX_WORKERS, per_host_limit=DEFAULT_PER_HOST_LIMIT, pool_maxsize=None):
+        """
+        Args:
+            pool_maxsize (int): 共享会话每个主机保持的长连接数，默认等于 per_host_limit
+        """
+        self.max_workers = max(1, int(max_workers))
+        self.per_host_limit = max(1, int(per_host_limit))
+        # 同一主机最多 per_host_limit 个请求同时进行，连接池按此保持长连接
+        configure_shared_session(pool_maxsize=pool_maxsize or self.per_host_limit)
+
+    def _poll_one(self, params, deadline):
+        """查询单个房间，等待主机信号量时不超过本轮截止时间"""
+        url = params.get('url', '')
+        semaphore = get_host_semaphore(url, self.per_host_limit)
+        if not semaphore.acquire(timeout=max(0, deadline - time.monotonic())):
+            logger.warning(f"等待主机并发名额超时，跳过房间: {url}")
+            return None
+        try:
+            return ElectricityQuery(**params).query()
+        finally:
+            semaphore.release()
+
+    def poll_one(self, params):
+        """在调用线程中查询单个房间（如手动测量），与定时查询共用主机并发上限
+
+        Returns:
+            float: 电量，失败或等待并发名额超时时返回 None
+        """
+        return self._poll_one(params, time.monotonic() + params.get('timeout', 15))
+
+    def poll(self, room_params_list, room_timeout=None):
+        """
+        并发查询多个房间
+
+        Args:
+            room_params_list (list): 每个房间的 ElectricityQuery 参数字典
+            room_timeout (float): 单个房间的超时时间(秒)，默认取参数中的 timeout
+
+        Returns:
+            list: [(url, balance), ...]，与输入顺序一致，失败或超时的房间 balance 为 None
+        """
+        if not room_params_list:
+            return []
+
+        if room_timeout is None:
+            room_timeout = max(params.get('timeout', 15) for params in room_params_list)
+
+        # 每个房间一次请求，按批次估算整轮截止时间
+        batches = -(-len(room_params_list) // min(self.max_workers, self.per_host_limit))
+        deadline = time.monotonic() + room_timeout * batches
+
+        results = [None] * len(room_params_list)
+        executor = ThreadPoolExecutor(max_workers=min(self.max_workers, len(room_params_list)),
+                                      thread_name_prefix='room-poller')
+        try:
+            futures = {executor.submit(self._poll_one, params, deadline): index
+                       for index, params in enumerate(room_params_list)}
+            done, not_done = wait(futures, timeout=max(0, deadline - time.monotonic()))
+
+            for future in done:
+                index = futures[future]
+                try:
+                    results[index] = future.result()
+                except Exception as e:
+                    logger.error(f"房间查询异常: {room_params_list[index].get('url', '')} - {e}")
+
+            for future in not_done:
+                logger.error(f"房间查询超时: {room_params_list[futures[future]].get('url', '')}")
+        finally:
+            # 不等待超时的线程结束，避免拖住调度任务
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        return [(params.get('url', ''), results[index])
+                for index, params in enumerate(room_params_list)]
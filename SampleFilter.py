@@ -0,0 +1,90 @@
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# 默认参数值
+DEFAULT_HEARTBEAT_SECONDS = 6 * 3600  # 电量不变时，每隔多久仍写入一条心跳样本
+
+
+class RoomSample:
+    """单个房间最近一次写入和最近一次观测的样本"""
+
+    __slots__ = ('balance', 'written_at', 'seen_at', 'suppressed')
+
+    def __init__(self, balance, written_at):
+        self.balance = balance
+        self.written_at = written_at  # 最近一次写入数据库的时间(datetime)
+        self.seen_at = written_at  # 最近一次查询到该电量的时间(datetime)
+        self.suppressed = 0  # 累计省略的样本数
+
+
+class SampleFilter:
+    """变化抑制写入类 - 电量不变时不写入样本，只定期写入心跳，读取时按阶梯曲线还原"""
+
+    def __init__(self, heartbeat_seconds=DEFAULT_HEARTBEAT_SECONDS):
+        self.heartbeat_seconds = heartbeat_seconds
+        self._rooms = {}
+        self._lock = threading.Lock()
+
+    def has_room(self, room_identifier):
+        """是否已有该房间的最近样本"""
+        with self._lock:
+            return room_identifier in self._rooms
+
+    def seed(self, room_identifier, balance, timestamp):
+        """用数据库中最后一条样本初始化房间状态，已存在时不覆盖"""
+        with self._lock:
+            if room_identifier not in self._rooms:
+                self._rooms[room_identifier] = RoomSample(float(balance), timestamp)
+
+    def should_write(self, room_identifier, balance, timestamp):
+        """
+        判断本次样本是否需要写入，并记录观测时间
+
+        电量变化、距上次写入超过心跳间隔或跨天时写入（保证每天都有汇总行）
+
+        Args:
+            room_identifier (str): 房间标识符
+            balance (float): 本次电量
+            timestamp (datetime): 本次样本时间
+
+        Returns:
+            bool: 是否写入数据库
+        """
+        balance = float(balance)
+        with self._lock:
+            sample = self._rooms.get(room_identifier)
+            if sample is None:
+                self._rooms[room_identifier] = RoomSample(balance, timestamp)
+                return True
+
+            sample.seen_at = timestamp
+            if (balance != sample.balance
+                    or (timestamp - sample.written_at).total_seconds() >= self.heartbeat_seconds
+                    or timestamp.date() != sample.written_at.date()):
+                sample.balance = balance
+                sample.written_at = timestamp
+                return True
+
+            sample.suppressed += 1
+            return False
+
+    def last_seen(self, room_identifier):
+        """最近一次查询到的 (电量, 时间)，尚无数据时返回None"""
+        with self._lock:
+            sample = self._rooms.get(room_identifier)
+            return (sample.balance, sample.seen_at) if sample else None
+
+    def snapshot(self):
+        """各房间最近写入、最近观测的时间和省略的样本数"""
+        with self._lock:
+            return {
+                room_identifier: {
+                    'balance': sample.balance,
+                    'written_at': sample.written_at.isoformat(),
+                    'seen_at': sample.seen_at.isoformat(),
+                    'suppressed': sample.suppressed
+                }
+                for room_identifier, sample in self._rooms.items()
+            }
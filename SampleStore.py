@@ -0,0 +1,256 @@
+import logging
+import threading
+import time
+from datetime import datetime
+
+from Database import get_db
+
+logger = logging.getLogger(__name__)
+
+# 默认参数值
+BALANCE_SCALE = 1000  # 电量按 0.001 度的定点整数保存
+LEGACY_ROOM = 'unknown'  # 旧版本没有房间标识的样本迁移到该房间
+DEFAULT_MIGRATION_BATCH = 5000  # 每批迁移的旧样本数
+DEFAULT_DROP_DELAY = 60  # 迁移完成后等待多久(秒)删除旧表，等待正在执行的读取结束
+
+
+def to_ts(moment):
+    """本地时间 -> epoch秒"""
+    return int(moment.timestamp())
+
+
+def from_ts(ts):
+    """epoch秒 -> 本地时间"""
+    return datetime.fromtimestamp(ts)
+
+
+def encode_balance(balance):
+    """电量 -> 定点整数"""
+    return int(round(float(balance) * BALANCE_SCALE))
+
+
+def decode_balance(value):
+    """定点整数 -> 电量"""
+    return value / BALANCE_SCALE
+
+
+class SampleStore:
+    """样本存储类 - 紧凑的 v2 样本表，房间字典和从旧表 electricity_data 的在线迁移
+
+    samples 按 (room_key, ts) 聚簇存储（WITHOUT ROWID），每行只有三个整数，
+    按房间和时间范围读取时直接扫描主键，不需要额外的索引和回表
+    """
+
+    def __init__(self, migration_batch=DEFAULT_MIGRATION_BATCH, drop_delay=DEFAULT_DROP_DELAY):
+        self.migration_batch = migration_batch
+        self.drop_delay = drop_delay
+        self._room_keys = {}  # room_identifier -> room_key
+        self._lock = threading.Lock()
+        self._migrated = False  # 迁移完成后不再检查迁移状态（只会从未完成变为完成）
+
+    @staticmethod
+    def init_table(conn):
+        """创建房间字典和样本表；存在旧表时登记迁移任务和旧表中的房间，迁移开始前即可按房间读取旧样本"""
+        conn.execute('''CREATE TABLE IF NOT EXISTS rooms
+                        (room_key INTEGER PRIMARY KEY,
+                         room_identifier TEXT NOT NULL UNIQUE,
+                         area_id TEXT,
+                         build_id TEXT,
+                         room_id TEXT)''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS samples
+                        (room_key INTEGER NOT NULL,
+                         ts INTEGER NOT NULL,  -- epoch秒
+                         balance INTEGER NOT NULL,  -- 电量 * BALANCE_SCALE
+                         PRIMARY KEY (room_key, ts)) WITHOUT ROWID''')
+        conn.execute('''CREATE TABLE IF NOT EXISTS sample_migration
+                        (id INTEGER PRIMARY KEY CHECK (id = 1),
+                         last_id INTEGER NOT NULL,  -- 已迁移的旧表最大id
+                         copied_at REAL)  -- 全部复制完成的时间(epoch秒)，NULL 表示未完成''')
+
+        legacy = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'electricity_data'")
+        if legacy.fetchone() is None:
+            return
+        if conn.execute("SELECT 1 FROM sample_migration").fetchone() is None:
+            conn.execute("INSERT INTO sample_migration (id, last_id) VALUES (1, 0)")
+            logger.info("检测到旧样本表，将在后台迁移到 samples 表")
+        if conn.execute("SELECT copied_at FROM sample_migration").fetchone()[0] is None:
+            SampleStore.register_legacy_rooms(conn)
+
+    def room_key(self, room_identifier, area_id='', build_id='', room_id='', create=True):
+        """
+        获取房间的整数键
+
+        Args:
+            create (bool): 房间不存在时是否登记；为 False 时不存在返回 None
+
+        Returns:
+            int: 房间键
+        """
+        key = self._room_keys.get(room_identifier)
+        if key is not None:
+            return key
+        conn = get_db()
+        row = conn.execute("SELECT room_key FROM rooms WHERE room_identifier = ?", (room_identifier,)).fetchone()
+        if row is None:
+            if not create:
+                return None
+            # 单独提交，不混入调用方的事务，避免事务回滚后缓存了不存在的键
+            with conn:
+                conn.execute('''INSERT OR IGNORE INTO rooms (room_identifier, area_id, build_id, room_id)
+                                VALUES (?, ?, ?, ?)''', (room_identifier, area_id, build_id, room_id))
+            row = conn.execute("SELECT room_key FROM rooms WHERE room_identifier = ?",
+                               (room_identifier,)).fetchone()
+        with self._lock:
+            self._room_keys[room_identifier] = row[0]
+        return row[0]
+
+    def rooms(self):
+        """所有房间 [(room_key, room_identifier), ...]"""
+        return get_db().execute("SELECT room_key, room_identifier FROM rooms ORDER BY room_key").fetchall()
+
+    def insert_many(self, conn, samples):
+        """
+        写入一批样本，在调用方的事务内执行；同一房间同一秒的样本保留最后一个
+
+        Args:
+            samples (list): [(room_key, datetime, balance), ...]
+        """
+        conn.executemany("INSERT OR REPLACE INTO samples (room_key, ts, balance) VALUES (?, ?, ?)",
+                         [(room_key, to_ts(moment), encode_balance(balance))
+                          for room_key, moment, balance in samples])
+
+    @staticmethod
+    def legacy_exists():
+        """旧表是否仍存在（未迁移完，或已复制完但尚未删除）"""
+        row = get_db().execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'electricity_data'")
+        return row.fetchone() is not None
+
+    def migration_pending(self):
+        """旧表中是否还有未迁移的样本"""
+        if self._migrated:
+            return False
+        row = get_db().execute("SELECT copied_at FROM sample_migration").fetchone()
+        if row is None or row[0] is not None:
+            self._migrated = True
+        return not self._migrated
+
+    def source(self):
+        """
+        读取样本用的表或子查询，列为 (room_key, ts, balance)
+
+        迁移期间合并旧表中尚未迁移的样本，迁移完成后直接读取 samples 表
+        """
+        if not self.migration_pending():
+            return 'samples'
+        return f'''(SELECT room_key, ts, balance FROM samples
+                    UNION ALL
+                    SELECT r.room_key, CAST(strftime('%s', l.timestamp, 'utc') AS INTEGER),
+                           CAST(ROUND(l.balance * {BALANCE_SCALE}) AS INTEGER)
+                    FROM electricity_data l
+                    JOIN rooms r ON r.room_identifier = COALESCE(l.room_identifier, '{LEGACY_ROOM}')
+                    WHERE l.id > (SELECT last_id FROM sample_migration))'''
+
+    @staticmethod
+    def register_legacy_rooms(conn):
+        """登记旧表中的所有房间，迁移期间读取未迁移的旧样本时按房间字典关联"""
+        # 每个房间取最后一行的房间信息，只扫描 (room_identifier, timestamp) 索引；先读后写，扫描期间不占用写锁
+        rows = conn.execute('''SELECT COALESCE(room_identifier, ?), area_id, build_id, room_id
+                               FROM electricity_data
+                               WHERE id IN (SELECT MAX(id) FROM electricity_data GROUP BY room_identifier)''',
+                            (LEGACY_ROOM,)).fetchall()
+        with conn:
+            conn.executemany('''INSERT OR IGNORE INTO rooms (room_identifier, area_id, build_id, room_id)
+                                VALUES (?, ?, ?, ?)''', rows)
+        logger.info(f"已登记旧表中的 {len(rows)} 个房间")
+
+    @staticmethod
+    def verify_copy(conn):
+        """
+        核对旧表中每个房间的样本是否都已复制到 samples 表
+
+        旧表中时间或电量为空的行不迁移，同一房间同一秒的多行只保留一行，
+        因此按 (房间, 秒) 去重后逐行检查 samples 中是否存在
+
+        Returns:
+            list: 有缺失的房间 [(room_identifier, 旧表样本数, 缺失数), ...]，全部一致时为空
+        """
+        return conn.execute('''SELECT l.room_identifier, COUNT(*),
+                                      SUM(NOT EXISTS (SELECT 1 FROM samples s
+                                                      WHERE s.room_key = r.room_key AND s.ts = l.ts))
+                               FROM (SELECT DISTINCT COALESCE(room_identifier, ?) AS room_identifier,
+                                            CAST(strftime('%s', timestamp, 'utc') AS INTEGER) AS ts
+                                     FROM electricity_data
+                                     WHERE timestamp IS NOT NULL AND balance IS NOT NULL) l
+                               LEFT JOIN rooms r USING (room_identifier)
+                               GROUP BY l.room_identifier
+                               HAVING SUM(NOT EXISTS (SELECT 1 FROM samples s
+                                                      WHERE s.room_key = r.room_key AND s.ts = l.ts)) > 0''',
+                            (LEGACY_ROOM,)).fetchall()
+
+    def migrate_step(self):
+        """
+        迁移一批旧样本，每批一个事务；全部复制完成后核对各房间的样本，一致时等待 drop_delay 秒后删除旧表，
+        不一致时保留旧表并停止迁移
+
+        Returns:
+            bool: 是否还有待迁移的样本
+        """
+        conn = get_db()
+        state = conn.execute("SELECT last_id, copied_at FROM sample_migration").fetchone()
+        if state is None:
+            return False
+        last_id, copied_at = state
+        if copied_at is not None:
+            if time.time() - copied_at < self.drop_delay:
+                return True
+            if self.legacy_exists():
+                with conn:
+                    conn.execute("DROP TABLE electricity_data")
+                logger.info("样本迁移完成，已删除旧表 electricity_data")
+            return False
+
+        rows = conn.execute('''SELECT id, timestamp, balance, room_identifier, area_id, build_id, room_id
+                               FROM electricity_data WHERE id > ? ORDER BY id LIMIT ?''',
+                            (last_id, self.migration_batch)).fetchall()
+        if not rows:
+            # 在标记复制完成之前核对（此时数据压缩尚未开始，samples 中的旧样本都还在）
+            missing = self.verify_copy(conn)
+            if missing:
+                for room_identifier, legacy_count, missing_count in missing:
+                    logger.error(f"房间 {room_identifier} 旧表有 {legacy_count} 个样本，"
+                                 f"其中 {missing_count} 个未复制到 samples 表")
+                logger.error("样本迁移核对失败，保留旧表 electricity_data，请检查后重新启动")
+                return False
+            with conn:
+                conn.execute("UPDATE sample_migration SET copied_at = ?", (time.time(),))
+            self._migrated = True
+            logger.info(f"旧样本已全部复制到 samples 表，{self.drop_delay}秒后删除旧表")
+            return True
+
+        samples = []
+        for _, timestamp, balance, room_identifier, area_id, build_id, room_id in rows:
+            if timestamp is None or balance is None:
+                continue
+            room_key = self.room_key(room_identifier or LEGACY_ROOM, area_id, build_id, room_id)
+            samples.append((room_key, to_ts(datetime.fromisoformat(str(timestamp))), encode_balance(balance)))
+        with conn:
+            # 新样本只写入 samples 表，迁移的旧样本与其时间冲突时保留新样本
+            conn.executemany("INSERT OR IGNORE INTO samples (room_key, ts, balance) VALUES (?, ?, ?)", samples)
+            conn.execute("UPDATE sample_migration SET last_id = ?", (rows[-1][0],))
+        return True
+
+    def migration_status(self):
+        """迁移进度"""
+        conn = get_db()
+        state = conn.execute("SELECT last_id, copied_at FROM sample_migration").fetchone()
+        if state is None:
+            return {'pending': False}
+        remaining = None
+        if self.migration_pending():
+            remaining = conn.execute("SELECT COUNT(*) FROM electricity_data WHERE id > ?", (state[0],)).fetchone()[0]
+        return {
+            'pending': remaining is not None,
+            'last_id': state[0],
+            'remaining': remaining,
+            'copied_at': datetime.fromtimestamp(state[1]).isoformat() if state[1] else None
+        }
@@ -0,0 +1,115 @@
+import logging
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# 默认参数值
+DEFAULT_BATCH_SIZE = 200  # 缓冲样本数达到该值时立即在后台写入
+DEFAULT_FLUSH_INTERVAL = 5.0  # 缓冲样本最长等待时间(秒)
+DEFAULT_MAX_BUFFER = 2000  # 缓冲上限，达到时由调用方同步写入，写入失败时丢弃最旧的样本
+
+
+class SampleWriter:
+    """批量写入类 - 缓冲一轮查询的样本，在一个事务内批量写入，每批只提交(fsync)一次"""
+
+    def __init__(self, write_batch, batch_size=DEFAULT_BATCH_SIZE,
+                 flush_interval=DEFAULT_FLUSH_INTERVAL, max_buffer=DEFAULT_MAX_BUFFER):
+        """
+        Args:
+            write_batch (callable): write_batch(samples)，在一个事务内写入一批样本
+        """
+        self.write_batch = write_batch
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_buffer = max_buffer
+        self._buffer = []
+        self._lock = threading.Lock()  # 保护缓冲区
+        self._flush_lock = threading.Lock()  # 保证同一时间只有一个批次在写入，样本按顺序落盘
+        self._wakeup = threading.Event()
+        self._closed = False
+        self._thread = None
+        self._flushes = 0
+        self._written = 0
+        self._dropped = 0
+        self._largest_batch = 0
+        self._last_flush_ms = None
+
+    def start(self):
+        """启动后台写入线程，重复调用无副作用"""
+        with self._lock:
+            if self._thread is not None or self._closed:
+                return
+            self._thread = threading.Thread(target=self._run, name='sample-writer', daemon=True)
+            self._thread.start()
+
+    def add(self, sample):
+        """加入一个样本，立即返回；缓冲区已满时在调用方线程同步写入"""
+        self.start()
+        with self._lock:
+            self._buffer.append(sample)
+            size = len(self._buffer)
+        if size >= self.max_buffer:
+            self.flush()
+        elif size >= self.batch_size:
+            self._wakeup.set()
+
+    def flush(self):
+        """把缓冲区中的样本在一个事务内写入，返回写入的样本数"""
+        with self._flush_lock:
+            with self._lock:
+                batch, self._buffer = self._buffer, []
+            if not batch:
+                return 0
+
+            started = time.perf_counter()
+            try:
+                self.write_batch(batch)
+            except Exception as e:
+                logger.error(f"批量写入{len(batch)}条样本失败: {e}")
+                with self._lock:
+                    # 放回缓冲区等待下次写入，超过上限时丢弃最旧的样本
+                    self._buffer = batch + self._buffer
+                    overflow = len(self._buffer) - self.max_buffer
+                    if overflow > 0:
+                        del self._buffer[:overflow]
+                        self._dropped += overflow
+                        logger.error(f"写入缓冲区已满，丢弃最旧的{overflow}条样本")
+                return 0
+
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            with self._lock:
+                self._flushes += 1
+                self._written += len(batch)
+                self._largest_batch = max(self._largest_batch, len(batch))
+                self._last_flush_ms = round(elapsed_ms, 2)
+            logger.info(f"批量写入{len(batch)}条样本，耗时{elapsed_ms:.1f}ms")
+            return len(batch)
+
+    def _run(self):
+        """后台线程：达到批量大小或等待超时后写入"""
+        while not self._closed:
+            self._wakeup.wait(self.flush_interval)
+            self._wakeup.clear()
+            self.flush()
+
+    def status(self):
+        """缓冲深度和写入统计"""
+        with self._lock:
+            return {
+                'buffered': len(self._buffer),
+                'flushes': self._flushes,
+                'written': self._written,
+                'dropped': self._dropped,
+                'largest_batch': self._largest_batch,
+                'last_flush_ms': self._last_flush_ms
+            }
+
+    def close(self, timeout=10):
+        """停止后台线程并写入剩余样本，用于进程退出"""
+        self._closed = True
+        self._wakeup.set()
+        thread = self._thread
+        if thread is not None:
+            thread.join(timeout)
+        self.flush()
@@ -0,0 +1,152 @@
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+
+from Database import get_db
+
+logger = logging.getLogger(__name__)
+
+# 默认参数值
+DEFAULT_LEASE_NAME = 'scheduler'
+DEFAULT_TTL_SECONDS = 60  # 租约有效期，持有者失联后最多经过该时间由其他进程接管
+
+
+class SchedulerLease:
+    """调度器租约类 - 多进程/多实例共用一个数据库时，只有持有租约的进程运行定时任务
+
+    租约记录在SQLite中，持有者每 ttl/3 秒续期一次；持有者退出时主动释放，
+    异常退出时租约到期后由其他进程接管。不同进程之间只能比较墙上时间，
+    同一数据库的各进程需使用同步的时钟（同一主机或容器内天然满足）
+    """
+
+    def __init__(self, name=DEFAULT_LEASE_NAME, ttl_seconds=DEFAULT_TTL_SECONDS,
+                 on_acquired=None, on_lost=None, on_renewed=None, on_heartbeat=None):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.renew_interval = max(1.0, ttl_seconds / 3)
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self.on_acquired = on_acquired  # 成为持有者后回调，如启动定时任务
+        self.on_lost = on_lost  # 失去租约后回调，如暂停定时任务
+        self.on_renewed = on_renewed  # 持有者每次续期后回调，如检查配置变化
+        self.on_heartbeat = on_heartbeat  # 每个进程每次尝试续期后回调，如发布本进程的状态
+        self.is_leader = False
+        self._renewed_at = None  # 最近一次成功续期的单调时钟时间
+        self._stop = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def init_table(conn):
+        """创建租约表"""
+        conn.execute('''CREATE TABLE IF NOT EXISTS scheduler_lease
+                        (name TEXT PRIMARY KEY,
+                         owner TEXT,
+                         expires_at REAL,  -- 租约到期时间(epoch秒)
+                         acquired_at REAL)''')
+
+    def try_acquire(self):
+        """获取或续期租约，单条UPSERT在数据库写锁内完成，不会有两个进程同时成功
+
+        Returns:
+            bool: 本进程是否持有租约
+        """
+        now = time.time()
+        conn = get_db()
+        with conn:
+            conn.execute('''INSERT INTO scheduler_lease (name, owner, expires_at, acquired_at)
+                            VALUES (?, ?, ?, ?)
+                            ON CONFLICT (name) DO UPDATE SET
+                                owner = excluded.owner,
+                                expires_at = excluded.expires_at,
+                                acquired_at = CASE WHEN scheduler_lease.owner = excluded.owner
+                                                   THEN scheduler_lease.acquired_at
+                                                   ELSE excluded.acquired_at END
+                            WHERE scheduler_lease.owner = excluded.owner
+                               OR scheduler_lease.expires_at < ?''',
+                         (self.name, self.owner, now + self.ttl_seconds, now, now))
+            row = conn.execute("SELECT owner FROM scheduler_lease WHERE name = ?", (self.name,)).fetchone()
+        return row is not None and row[0] == self.owner
+
+    def _step(self):
+        """续期一次并处理持有状态的变化"""
+        try:
+            held = self.try_acquire()
+            if held:
+                self._renewed_at = time.monotonic()
+        except Exception as e:
+            logger.error(f"续期调度器租约失败: {e}")
+            # 数据库暂时不可用时，租约到期前保持原状态，到期后主动退出，避免与接管者重复执行
+            held = (self.is_leader and self._renewed_at is not None
+                    and time.monotonic() - self._renewed_at < self.ttl_seconds * 0.8)
+
+        with self._lock:
+            changed = held != self.is_leader
+            self.is_leader = held
+        if changed and held:
+            logger.info(f"已获得调度器租约，由本进程运行定时任务: {self.owner}")
+            self._callback(self.on_acquired)
+        elif changed:
+            logger.warning(f"已失去调度器租约，停止运行定时任务: {self.owner}")
+            self._callback(self.on_lost)
+        if held:
+            self._callback(self.on_renewed)
+        self._callback(self.on_heartbeat)
+
+    @staticmethod
+    def _callback(callback):
+        """执行回调，异常只记录日志"""
+        if callback is None:
+            return
+        try:
+            callback()
+        except Exception as e:
+            logger.error(f"调度器租约回调执行失败: {e}")
+
+    def _run(self):
+        """后台线程：定期尝试获取或续期租约"""
+        while not self._stop.is_set():
+            self._step()
+            self._stop.wait(self.renew_interval)
+
+    def start(self):
+        """启动租约线程，重复调用无副作用"""
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='scheduler-lease', daemon=True)
+        self._thread.start()
+
+    def release(self):
+        """停止续期并释放租约，其他进程在下一次续期时即可接管"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(self.renew_interval + 5)
+        with self._lock:
+            was_leader, self.is_leader = self.is_leader, False
+        if not was_leader:
+            return
+        try:
+            conn = get_db()
+            with conn:
+                conn.execute("UPDATE scheduler_lease SET expires_at = 0 WHERE name = ? AND owner = ?",
+                             (self.name, self.owner))
+            logger.info(f"已释放调度器租约: {self.owner}")
+        except Exception as e:
+            logger.error(f"释放调度器租约失败: {e}")
+        self._callback(self.on_lost)
+
+    def snapshot(self):
+        """本进程和当前租约持有者的状态"""
+        row = get_db().execute("SELECT owner, expires_at, acquired_at FROM scheduler_lease WHERE name = ?",
+                               (self.name,)).fetchone()
+        now = time.time()
+        return {
+            'owner': self.owner,
+            'is_leader': self.is_leader,
+            'holder': row[0] if row else None,
+            'expires_in': max(0, round(row[1] - now)) if row else None,
+            'held_for': round(now - row[2]) if row and row[2] else None
+        }
@@ -0,0 +1,92 @@
+import json
+import logging
+import threading
+import time
+
+from Database import get_db
+
+logger = logging.getLogger(__name__)
+
+# 默认参数值
+DEFAULT_STALE_SECONDS = 3600  # 超过该时间未更新的状态（如已退出进程的状态）在发布时删除
+
+
+class StatusBoard:
+    """运行状态共享类 - 运行定时任务的进程把各模块的运行状态写入SQLite，其他进程读取
+
+    调度器、推送队列、熔断器等状态只存在于运行定时任务的进程内，
+    多进程部署时请求可能落在任一进程，状态接口读取最近一次发布的状态；
+    各进程自己的状态（如监控指标）按进程分别发布，读取时合并
+    """
+
+    def __init__(self, stale_seconds=DEFAULT_STALE_SECONDS):
+        self.stale_seconds = stale_seconds
+        self._providers = {}  # 名称 -> 返回可JSON序列化状态的函数
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def init_table(conn):
+        """创建运行状态表"""
+        conn.execute('''CREATE TABLE IF NOT EXISTS runtime_status
+                        (name TEXT PRIMARY KEY,
+                         owner TEXT,  -- 发布状态的进程
+                         data TEXT,  -- JSON
+                         published_at REAL)''')
+
+    def register(self, name, provider):
+        """登记一项运行状态"""
+        with self._lock:
+            self._providers[name] = provider
+
+    def publish(self, owner):
+        """采集所有登记的状态并在一个事务内写入，单项采集失败只记录日志"""
+        with self._lock:
+            providers = list(self._providers.items())
+        rows = []
+        now = time.time()
+        for name, provider in providers:
+            try:
+                rows.append((name, owner, json.dumps(provider()), now))
+            except Exception as e:
+                logger.error(f"采集运行状态 {name} 失败: {e}")
+        conn = get_db()
+        with conn:
+            self._upsert(conn, rows)
+            conn.execute("DELETE FROM runtime_status WHERE published_at < ?", (now - self.stale_seconds,))
+
+    def publish_process(self, name, owner, data):
+        """发布本进程的一项状态，按 name:owner 分别保存"""
+        conn = get_db()
+        with conn:
+            self._upsert(conn, [(f'{name}:{owner}', owner, json.dumps(data), time.time())])
+
+    @staticmethod
+    def _upsert(conn, rows):
+        conn.executemany('''INSERT INTO runtime_status (name, owner, data, published_at)
+                            VALUES (?, ?, ?, ?)
+                            ON CONFLICT (name) DO UPDATE SET
+                                owner = excluded.owner,
+                                data = excluded.data,
+                                published_at = excluded.published_at''', rows)
+
+    def read(self, name):
+        """
+        读取最近一次发布的状态
+
+        Returns:
+            object: 发布的状态，尚未发布时返回 None
+        """
+        row = get_db().execute("SELECT data FROM runtime_status WHERE name = ?", (name,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def read_processes(self, name, max_age):
+        """
+        读取各进程最近 max_age 秒内发布的一项状态
+
+        Returns:
+            list: [(owner, 状态), ...]
+        """
+        rows = get_db().execute('''SELECT owner, data FROM runtime_status
+                                   WHERE name >= ? AND name < ? AND published_at >= ?''',
+                                (f'{name}:', f'{name};', time.time() - max_age)).fetchall()
+        return [(owner, json.loads(data)) for owner, data in rows]
@@ -1,16 +1,32 @@
+import atexit
 import threading
 import time
-import sqlite3
 import json
 import os
+from contextlib import contextmanager
 from urllib.parse import urlparse, parse_qs
-from flask import Flask, render_template, request, jsonify, url_for
+from flask import Flask, Response, render_template, request, jsonify, url_for
 from flask_apscheduler import APScheduler
+from apscheduler.events import EVENT_JOB_MAX_INSTANCES, EVENT_JOB_MISSED
 from datetime import datetime, timedelta
 import logging
-from ElectricityQuery import ElectricityQuery  # 电量查询模块
-from Pushplus import PushPlusNotifier  # 推送模块 - 修正类名
-from Buypower import generate_recharge_url, WechatMsgGenerator
+from ElectricityQuery import ElectricityQuery, get_connection_stats, get_strategy_stats, get_conditional_stats  # 电量查询模块
+from NotifyDispatcher import NotifyDispatcher  # 推送分发队列模块
+from Pushplus import get_latency_stats  # 推送模块
+from Buypower import build_recharge_message, AlertDigestGenerator
+from RoomPoller import RoomPoller  # 多房间并发查询模块
+from Database import get_db  # 数据库连接管理模块
+from ConsumptionForecast import ConsumptionEstimator  # 用电速率估计模块
+from AlertState import AlertEngine  # 告警状态机模块
+from PollPlanner import PollPlanner  # 分散自适应查询计划模块
+from CircuitBreaker import get_breaker_states  # 熔断器模块
+from SampleFilter import SampleFilter  # 变化抑制写入模块
+from SampleWriter import SampleWriter  # 批量写入模块
+from SchedulerLease import SchedulerLease  # 调度器租约模块
+from StatusBoard import StatusBoard  # 运行状态共享模块
+from Retention import RetentionManager  # 分级保留与压缩模块
+from SampleStore import SampleStore, BALANCE_SCALE, to_ts, from_ts, decode_balance  # 样本存储模块
+import Metrics  # 监控指标模块
 
 # 初始化Flask应用
 app = Flask(__name__)
@@ -26,21 +42,57 @@ logger = logging.getLogger(__name__)
 
 # 全局变量，用于存储当前定时任务
 current_scheduler_job = None
-# 推送频率控制
-LAST_PUSH_TIME = {}  # 记录每个房间最后一次推送的时间
-PUSH_COOLDOWN = 50  # 冷却时间（单位：秒）
-# 默认配置
-# 默认配置
+# 本进程是否负责运行定时任务（多进程部署时只有持有调度器租约的进程为 True）
+scheduler_active = False
+# 分散查询模式下的查询计划，以及检查到期房间的节拍
+poll_planner = PollPlanner()
+SPREAD_TICK_SECONDS = 30
+SCHEDULER_JOB_ID = 'electricity_query'
+# 原始样本压缩任务的执行间隔
+RETENTION_JOB_ID = 'retention_compaction'
+RETENTION_INTERVAL_MINUTES = 60
+# 旧样本表在线迁移任务的执行间隔和每次运行的时间上限
+MIGRATION_JOB_ID = 'sample_migration'
+MIGRATION_INTERVAL_SECONDS = 5
+MIGRATION_TIME_BUDGET = 2.0
+# 推送频率控制：按房间的告警状态机，冷却期内不重复提醒
+alert_engine = AlertEngine()
+# 后台推送分发队列，路由和定时任务只负责入队
+notify_dispatcher = NotifyDispatcher()
+# 运行定时任务的进程发布的运行状态，其他进程的状态接口读取
+status_board = StatusBoard()
+# 配置缓存
+_config_cache = None  # 当前配置，None 表示尚未从数据库加载
+_config_version = 0  # 配置版本号
+_config_lock = threading.Lock()
+_config_listeners = []  # 配置变更回调
+_config_db_version = None  # 缓存对应的数据库中的配置版本
+_config_checked_at = 0.0  # 最近一次检查数据库配置版本的单调时钟时间
+CONFIG_REFRESH_SECONDS = 5  # 检查其他进程是否修改配置的间隔
 # 默认配置
 DEFAULT_CONFIG = {
     'threshold': 20.0,
+    'forecast_hours': 24,  # 预计在该小时数内用完时也发送提醒，0 表示关闭
+    'alert_cooldown': 360,  # 同一房间重复提醒的冷却时间（分钟）
+    'alert_digest': True,  # 一轮查询中多个房间低电量时合并为一条推送
     'query_interval': 30,
+    'schedule_mode': 'sweep',  # sweep: 每个间隔查询全部房间；spread: 各房间错开查询并自适应调整频率
+    'write_mode': 'changes',  # changes: 只写入电量变化和心跳样本；all: 每次查询都写入
+    'heartbeat_interval': 360,  # 电量不变时写入心跳样本的间隔（分钟）
+    'raw_retention_days': 90,  # 原始样本保留天数，之后汇总为小时数据，0 表示永久保留
+    'hourly_retention_months': 12,  # 小时汇总保留月数，按天汇总永久保留，0 表示永久保留
     'default_recharge_amount': 100,  # 新增默认充值金额
     'electricity_params': {
         'url': '',
         'html_encode': 'utf-8',
         'timeout': 15
     },
+    'room_urls': [],  # 额外监控的房间URL（主URL之外）
+    'poll_params': {
+        'max_workers': 16,  # 并发查询线程数
+        'per_host_limit': 4,  # 同一主机最大并发请求数
+        'pool_maxsize': None  # 每个主机保持的长连接数，默认等于 per_host_limit
+    },
     'push_params': {
         'token': '',
         'channel': ['mail'],
@@ -48,30 +100,115 @@ DEFAULT_CONFIG = {
     }
 }
 
+# 各房间的用电速率估计，新样本写入时增量更新
+consumption_estimator = ConsumptionEstimator()
+FORECAST_WARMUP_DAYS = 3  # 首次见到房间时用于预热估计的历史天数
+
+# 各房间最近写入的样本，电量不变时省略写入
+sample_filter = SampleFilter()
+
+# 样本存储：房间字典、紧凑样本表和旧表的在线迁移
+sample_store = SampleStore()
+
+# 原始样本分级保留：过期样本分批汇总为小时数据后删除
+retention_manager = RetentionManager(sample_store)
+
+# 历史曲线默认最多返回的点数，超过时服务端降采样
+HISTORY_MAX_POINTS = 1000
+
+# 监控指标：数据库读写耗时、定时任务耗时和超时次数
+DB_SECONDS = Metrics.histogram('sqlite_operation_seconds', 'SQLite读写耗时(秒)', ('operation',))
+DB_ROWS_WRITTEN = Metrics.counter('sqlite_rows_written_total', '写入samples的样本数')
+JOB_SECONDS = Metrics.histogram('scheduler_job_seconds', '定时任务执行耗时(秒)', ('job',),
+                                buckets=(0.1, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0))
+JOB_OVERRUNS = Metrics.counter('scheduler_job_overruns_total', '执行耗时超过调度间隔的次数', ('job',))
+JOB_SKIPPED = Metrics.counter('scheduler_job_skipped_total', '因上一次未结束或错过时间而跳过的执行次数', ('job',))
+
 # 校区和楼栋映射
 AREA_MAPPING = {'2': '奉贤校区', '3': '徐汇校区'}
 BUILDING_MAPPING = {'3': '3号楼'}
 
 
+# 写入样本时增量更新当天汇总；SET 子句中的列名引用的是更新前的值
+DAILY_UPSERT_SQL = '''INSERT INTO electricity_daily
+                      (room_identifier, day, open_balance, close_balance, min_balance, max_balance,
+                       consumption, sample_count, last_timestamp)
+                      VALUES (?, ?, ?, ?, ?, ?, 0, 1, ?)
+                      ON CONFLICT (room_identifier, day) DO UPDATE SET
+                          consumption = consumption + MAX(close_balance - excluded.close_balance, 0),
+                          close_balance = excluded.close_balance,
+                          min_balance = MIN(min_balance, excluded.min_balance),
+                          max_balance = MAX(max_balance, excluded.max_balance),
+                          sample_count = sample_count + 1,
+                          last_timestamp = excluded.last_timestamp'''
+
+# 根据单个房间的原始样本生成按天汇总，已有的日期保持不变
+DAILY_BACKFILL_SQL = f'''INSERT OR IGNORE INTO electricity_daily
+                        (room_identifier, day, open_balance, close_balance, min_balance, max_balance,
+                         consumption, sample_count, last_timestamp)
+                        WITH rows AS (
+                            SELECT room_key, ts, balance * 1.0 / {BALANCE_SCALE} AS balance,
+                                   date(ts, 'unixepoch', 'localtime') AS day
+                            FROM samples WHERE room_key = ?),
+                        daily AS (
+                            SELECT room_key, day, ts, balance,
+                                   LAG(balance) OVER w AS prev_balance,
+                                   ROW_NUMBER() OVER w AS rn_first,
+                                   ROW_NUMBER() OVER (PARTITION BY room_key, day ORDER BY ts DESC) AS rn_last
+                            FROM rows
+                            WINDOW w AS (PARTITION BY room_key, day ORDER BY ts))
+                        SELECT r.room_identifier, day,
+                               MAX(CASE WHEN rn_first = 1 THEN balance END),
+                               MAX(CASE WHEN rn_last = 1 THEN balance END),
+                               MIN(balance), MAX(balance),
+                               SUM(MAX(COALESCE(prev_balance - balance, 0), 0)),
+                               COUNT(*), datetime(MAX(ts), 'unixepoch', 'localtime')
+                        FROM daily JOIN rooms r USING (room_key)
+                        WHERE true GROUP BY room_key, day'''
+
+
 def init_db():
     """初始化数据库 - 支持多房间数据隔离"""
-    conn = sqlite3.connect('electricity.db')
+    conn = get_db()
     c = conn.cursor()
 
-    # 创建电费数据表，增加room_identifier字段用于区分不同房间
-    c.execute('''CREATE TABLE IF NOT EXISTS electricity_data
-                 (id INTEGER PRIMARY KEY AUTOINCREMENT, 
-                  timestamp DATETIME, 
-                  balance REAL,
-                  room_identifier TEXT,  -- 房间唯一标识符
-                  area_id TEXT,
-                  build_id TEXT,
-                  room_id TEXT)''')
-
-    # 创建配置表
+    # 创建房间字典和样本表（按房间+时间聚簇），旧数据库的 electricity_data 由后台任务在线迁移
+    SampleStore.init_table(conn)
+
+    # 创建按天汇总表，写入样本时增量维护，自定义时间段查询只读该表
+    c.execute('''CREATE TABLE IF NOT EXISTS electricity_daily
+                 (room_identifier TEXT,
+                  day TEXT,  -- 日期 YYYY-MM-DD
+                  open_balance REAL,
+                  close_balance REAL,
+                  min_balance REAL,
+                  max_balance REAL,
+                  consumption REAL,  -- 当天用电量，不含充值带来的增加
+                  sample_count INTEGER,
+                  last_timestamp DATETIME,
+                  PRIMARY KEY (room_identifier, day))''')
+
+    # 旧数据库的按天汇总由样本迁移任务在复制完成后按房间回填
+
+    # 创建小时汇总表，保存超过原始样本保留期的数据
+    RetentionManager.init_table(conn)
+
+    # 创建告警状态表
+    AlertEngine.init_table(conn)
+
+    # 创建配置表，version 每次保存配置时递增，供其他进程判断配置是否变化
     c.execute('''CREATE TABLE IF NOT EXISTS app_config
                  (id INTEGER PRIMARY KEY, 
-                  config_data TEXT)''')
+                  config_data TEXT,
+                  version INTEGER NOT NULL DEFAULT 0)''')
+    if 'version' not in [row[1] for row in c.execute("PRAGMA table_info(app_config)")]:
+        c.execute("ALTER TABLE app_config ADD COLUMN version INTEGER NOT NULL DEFAULT 0")
+
+    # 创建调度器租约表
+    SchedulerLease.init_table(conn)
+
+    # 创建运行状态表
+    StatusBoard.init_table(conn)
 
     conn.commit()
 
@@ -81,30 +218,76 @@ def init_db():
         c.execute("INSERT INTO app_config (id, config_data) VALUES (1, ?)",
                   (json.dumps(DEFAULT_CONFIG),))
     conn.commit()
-    conn.close()
 
 
 def get_config():
-    """获取当前配置"""
-    conn = sqlite3.connect('electricity.db')
-    c = conn.cursor()
-    c.execute("SELECT config_data FROM app_config WHERE id = 1")
-    result = c.fetchone()
-    conn.close()
-    return json.loads(result[0]) if result else DEFAULT_CONFIG
+    """获取当前配置，读取进程内缓存
 
+    多进程部署时其他进程可能修改配置：每隔 CONFIG_REFRESH_SECONDS 秒只读取一次数据库中的版本号，
+    版本变化时重新加载并通知配置变更回调。返回的配置对象在各调用方之间共享，修改前请先复制
+    """
+    global _config_cache, _config_version, _config_db_version, _config_checked_at
+    config = _config_cache
+    if config is not None and time.monotonic() - _config_checked_at < CONFIG_REFRESH_SECONDS:
+        return config
+
+    changed = False
+    with _config_lock:
+        if _config_cache is None or time.monotonic() - _config_checked_at >= CONFIG_REFRESH_SECONDS:
+            conn = get_db()
+            row = conn.execute("SELECT version FROM app_config WHERE id = 1").fetchone()
+            db_version = row[0] if row else None
+            if _config_cache is None or db_version != _config_db_version:
+                result = conn.execute("SELECT config_data FROM app_config WHERE id = 1").fetchone()
+                changed = _config_cache is not None
+                _config_cache = json.loads(result[0]) if result else DEFAULT_CONFIG
+                _config_db_version = db_version
+                _config_version += 1
+            _config_checked_at = time.monotonic()
+        config = _config_cache
+
+    if changed:
+        logger.info("检测到其他进程修改了配置，已重新加载")
+        notify_config_listeners(config)
+    return config
+
+
+def get_config_version():
+    """获取配置版本号，每次保存配置后递增，长时间运行的任务可据此判断配置是否变化"""
+    return _config_version
+
+
+def register_config_listener(callback):
+    """注册配置变更回调，回调参数为新的配置"""
+    _config_listeners.append(callback)
 
-def save_config(config):
-    """保存配置"""
-    conn = sqlite3.connect('electricity.db')
-    c = conn.cursor()
-    c.execute("UPDATE app_config SET config_data = ? WHERE id = 1",
-              (json.dumps(config),))
-    conn.commit()
-    conn.close()
 
-    # 配置保存后，重新设置定时任务
-    setup_scheduler()
+def save_config(config):
+    """保存配置，并原子地更新配置缓存；数据库中的版本号递增，其他进程据此重新加载"""
+    global _config_cache, _config_version, _config_db_version, _config_checked_at
+    with _config_lock:
+        conn = get_db()
+        conn.execute("UPDATE app_config SET config_data = ?, version = version + 1 WHERE id = 1",
+                     (json.dumps(config),))
+        row = conn.execute("SELECT version FROM app_config WHERE id = 1").fetchone()
+        conn.commit()
+        # 存入副本，避免调用方之后修改传入的字典（如 DEFAULT_CONFIG）
+        _config_cache = json.loads(json.dumps(config))
+        _config_db_version = row[0] if row else None
+        _config_checked_at = time.monotonic()
+        _config_version += 1
+
+    # 通知配置变更，如重新设置定时任务
+    notify_config_listeners(_config_cache)
+
+
+def notify_config_listeners(config):
+    """依次执行配置变更回调"""
+    for callback in list(_config_listeners):
+        try:
+            callback(config)
+        except Exception as e:
+            logger.error(f"配置变更回调执行失败: {e}")
 
 
 def parse_room_info(url):
@@ -144,41 +327,250 @@ def get_room_identifier(url):
 
 def save_electricity_data(balance, url):
     """保存电量数据到数据库，按房间隔离"""
+    with DB_SECONDS.time('save_sample'):
+        _save_electricity_data(balance, url)
+
+
+def _save_electricity_data(balance, url):
+    """预热估计、变化抑制后加入写入缓冲"""
     room_identifier, area_id, build_id, room_id = get_room_identifier(url)
 
-    conn = sqlite3.connect('electricity.db')
-    c = conn.cursor()
-    c.execute('''INSERT INTO electricity_data 
-                 (timestamp, balance, room_identifier, area_id, build_id, room_id) 
-                 VALUES (?, ?, ?, ?, ?, ?)''',
-              (datetime.now(), float(balance), room_identifier, area_id, build_id, room_id))
-    conn.commit()
-    conn.close()
+    now = datetime.now()
+    balance = float(balance)
+
+    # 先预热（读取已有历史），再加入本次样本
+    if not consumption_estimator.has_room(room_identifier):
+        warm_up_estimator(room_identifier)
+    consumption_estimator.update(room_identifier, balance, now.timestamp())
+
+    # 电量未变化且未到心跳时间时不写入，读取历史时按阶梯曲线还原
+    config = get_config()
+    if not sample_filter.has_room(room_identifier):
+        seed_sample_filter(room_identifier)
+    sample_filter.heartbeat_seconds = config.get('heartbeat_interval', DEFAULT_CONFIG['heartbeat_interval']) * 60
+    changed = sample_filter.should_write(room_identifier, balance, now)
+    if not changed and config.get('write_mode', 'changes') == 'changes':
+        logger.info(f"电量未变化，省略写入: 房间{room_identifier} - {balance}度")
+        return
+
+    # 加入写入缓冲，由后台线程按批写入
+    sample_writer.add((now, balance, room_identifier, area_id, build_id, room_id))
 
     logger.info(f"保存电量数据: 房间{room_identifier} - {balance}度")
 
 
-def get_electricity_history(days=30, room_identifier=None):
-    """获取电量历史数据，支持按房间筛选"""
-    conn = sqlite3.connect('electricity.db')
-    c = conn.cursor()
+def write_samples(samples):
+    """在一个事务内批量写入样本并更新按天汇总，每批只提交一次"""
+    conn = get_db()
+    # 房间键在事务外获取，新房间的登记单独提交
+    rows = [(sample_store.room_key(room_identifier, area_id, build_id, room_id), now, balance)
+            for now, balance, room_identifier, area_id, build_id, room_id in samples]
+    with DB_SECONDS.time('write_batch'), conn:
+        sample_store.insert_many(conn, rows)
+        # 同一批内同一房间同一天的样本按顺序累加
+        conn.executemany(DAILY_UPSERT_SQL, [
+            (room_identifier, now.strftime('%Y-%m-%d'), balance, balance, balance, balance, now)
+            for now, balance, room_identifier, _, _, _ in samples
+        ])
+    DB_ROWS_WRITTEN.inc(amount=len(samples))
+
+
+# 样本写入缓冲，一轮查询的样本合并为一个事务；进程退出前写入剩余样本
+sample_writer = SampleWriter(write_samples)
+atexit.register(sample_writer.close)
+
+
+def seed_sample_filter(room_identifier):
+    """用数据库中该房间最后一条样本初始化变化抑制状态"""
+    room_key = sample_store.room_key(room_identifier, create=False)
+    if room_key is None:
+        return
+    row = get_db().execute(f'''SELECT ts, balance FROM {sample_store.source()}
+                               WHERE room_key = ?
+                               ORDER BY ts DESC LIMIT 1''',
+                           (room_key,)).fetchone()
+    if row:
+        sample_filter.seed(room_identifier, decode_balance(row[1]), from_ts(row[0]))
+
+
+def warm_up_estimator(room_identifier):
+    """用历史数据初始化房间的用电速率估计：首次读取最近几天，已跟踪的房间只读取估计之后写入的样本"""
+    room_key = sample_store.room_key(room_identifier, create=False)
+    if room_key is None:
+        return
+    forecast = consumption_estimator.forecast(room_identifier)
+    since = forecast['updated_at'] if forecast else to_ts(datetime.now() - timedelta(days=FORECAST_WARMUP_DAYS))
+    c = get_db().execute(f'''SELECT ts, balance FROM {sample_store.source()}
+                             WHERE ts > ? AND room_key = ?
+                             ORDER BY ts''',
+                         (since, room_key))
+    for ts, balance in c.fetchall():
+        consumption_estimator.update(room_identifier, decode_balance(balance), ts)
+
+
+def get_forecast(room_identifier):
+    """获取房间的电量耗尽预测，尚未跟踪的房间先用历史数据预热
+
+    不运行定时任务的进程每次读取其他进程写入的新样本，预测随定时查询更新
+    """
+    if not scheduler_active or not consumption_estimator.has_room(room_identifier):
+        warm_up_estimator(room_identifier)
+    return consumption_estimator.forecast(room_identifier)
+
+
+def get_electricity_history(days=30, room_identifier=None, max_points=None):
+    """获取电量历史数据，支持按房间筛选
+
+    指定 max_points 且样本数超过该值时，按时间分桶降采样，
+    每个桶保留最低、最高和最后一个样本，低电量的谷值不会被平滑掉
+    """
+    with DB_SECONDS.time('history_read'):
+        return _get_electricity_history(days, room_identifier, max_points)
+
+
+def _get_electricity_history(days, room_identifier, max_points):
+    """读取、降采样并还原阶梯曲线"""
+    c = get_db().cursor()
     start_date = datetime.now() - timedelta(days=days)
 
     if room_identifier:
-        # 获取特定房间的数据
-        c.execute('''SELECT timestamp, balance FROM electricity_data 
-                     WHERE timestamp > ? AND room_identifier = ? 
-                     ORDER BY timestamp''',
-                  (start_date, room_identifier))
+        # 获取特定房间的数据，按 (room_key, ts) 主键范围扫描
+        room_key = sample_store.room_key(room_identifier, create=False)
+        if room_key is None:
+            return []
+        where, params = "ts > ? AND room_key = ?", (to_ts(start_date), room_key)
     else:
         # 获取所有房间的数据（向后兼容）
-        c.execute('''SELECT timestamp, balance FROM electricity_data 
-                     WHERE timestamp > ? ORDER BY timestamp''',
-                  (start_date,))
+        where, params = "ts > ?", (to_ts(start_date),)
+
+    source = sample_store.source()
+    cutoff = RetentionManager.raw_cutoff(get_config().get('raw_retention_days', DEFAULT_CONFIG['raw_retention_days']))
+    if cutoff is not None and start_date < cutoff:
+        # 早于原始样本保留期的部分由小时汇总代替，每小时一个点（该小时最后的电量）
+        source = f'''(SELECT room_key, ts, balance FROM {source}
+                      UNION ALL
+                      SELECT r.room_key, CAST(strftime('%s', h.hour, '+3599 seconds', 'utc') AS INTEGER),
+                             CAST(ROUND(h.close_balance * {BALANCE_SCALE}) AS INTEGER)
+                      FROM electricity_hourly h JOIN rooms r USING (room_identifier))'''
+
+    if max_points:
+        # 同一次扫描取得样本数和实际时间跨度，数据少于请求的时间段时按实际跨度分桶
+        count, first_ts, last_ts = c.execute(f"SELECT COUNT(*), MIN(ts), MAX(ts) FROM {source} WHERE {where}",
+                                             params).fetchone()
+        if count > max_points:
+            data = downsample_history(c, source, where, params, first_ts, last_ts, max_points)
+            return expand_steps(data, room_identifier, start_date) if room_identifier else data
+
+    c.execute(f'''SELECT ts, balance FROM {source}
+                  WHERE {where} ORDER BY ts''', params)
+
+    data = [{'timestamp': str(from_ts(row[0])), 'balance': decode_balance(row[1])} for row in c.fetchall()]
+    if room_identifier:
+        # 变化抑制写入下，两条样本之间电量保持不变，按阶梯曲线还原
+        hold_seconds = max(1, get_config().get('query_interval', 30)) * 60
+        return expand_steps(data, room_identifier, start_date, hold_seconds)
+    return data
+
+
+def get_last_seen(room_identifier):
+    """最近一次查询到的 (电量, 时间)
+
+    定时查询只在运行定时任务的进程中更新变化抑制状态，其他进程同时参考该进程发布的状态，取较新的一个
+    """
+    last_seen = sample_filter.last_seen(room_identifier)
+    if scheduler_active:
+        return last_seen
+    published = (status_board.read('write_stats') or {}).get('rooms', {}).get(room_identifier)
+    if published:
+        shared = (published['balance'], datetime.fromisoformat(published['seen_at']))
+        if last_seen is None or shared[1] > last_seen[1]:
+            return shared
+    return last_seen
+
+
+def expand_steps(data, room_identifier, start_date, hold_seconds=None):
+    """
+    把只记录变化的样本还原为阶梯曲线
+
+    - 起点：沿用时间段开始前的最后一个电量
+    - 相邻样本间隔超过 hold_seconds 时，在后一个样本前补一个保持原电量的点
+    - 终点：延伸到最近一次查询的时间（未写入的心跳之间）
+    """
+    points = []
+    carry_in = get_db().execute(f'''SELECT balance * 1.0 / {BALANCE_SCALE} FROM {sample_store.source()}
+                                    WHERE room_key = ? AND ts <= ?
+                                    ORDER BY ts DESC LIMIT 1''',
+                                (sample_store.room_key(room_identifier, create=False), to_ts(start_date))).fetchone()
+    if carry_in is None:
+        # 起点早于原始样本保留期时，沿用小时汇总中的电量
+        carry_in = get_db().execute('''SELECT close_balance FROM electricity_hourly
+                                       WHERE room_identifier = ? AND hour <= ?
+                                       ORDER BY hour DESC LIMIT 1''',
+                                    (room_identifier, str(start_date))).fetchone()
+    previous_time = None
+    if carry_in is not None:
+        points.append({'timestamp': str(start_date), 'balance': float(carry_in[0])})
+        previous_time = start_date
+
+    for point in data:
+        timestamp = datetime.fromisoformat(str(point['timestamp']))
+        if (hold_seconds and points and previous_time is not None
+                and point['balance'] != points[-1]['balance']
+                and (timestamp - previous_time).total_seconds() > hold_seconds * 1.5):
+            hold_time = timestamp - timedelta(seconds=hold_seconds)
+            points.append({'timestamp': str(hold_time), 'balance': points[-1]['balance']})
+        points.append(point)
+        previous_time = timestamp
+
+    last_seen = get_last_seen(room_identifier)
+    # 样本时间按秒保存，同一秒内的最近查询不再重复追加
+    if last_seen and points and (previous_time is None or (last_seen[1] - previous_time).total_seconds() >= 1):
+        points.append({'timestamp': str(last_seen[1]), 'balance': last_seen[0]})
+    return points
+
+
+def downsample_history(c, source, where, params, first_ts, last_ts, max_points):
+    """在SQLite中把 first_ts 到 last_ts 之间的样本按时间分桶聚合，每桶输出 最低/最高/最后 三个点"""
+    buckets = max(1, max_points // 3)
+    bucket_seconds = max(1.0, (last_ts - first_ts + 1) / buckets)
+
+    # 分桶与聚合都在SQLite内一次完成，Python侧不逐行处理原始样本；
+    # 裸列配合 MIN/MAX 聚合时取自对应的那一行
+    c.execute(f'''WITH points AS (
+                      SELECT ts, balance, CAST((ts - ?) / ? AS INTEGER) AS bucket
+                      FROM {source} WHERE {where})
+                  SELECT ts, balance FROM (
+                      SELECT ts, MIN(balance) AS balance FROM points GROUP BY bucket
+                      UNION
+                      SELECT ts, MAX(balance) FROM points GROUP BY bucket
+                      UNION
+                      SELECT MAX(ts), balance FROM points GROUP BY bucket)
+                  ORDER BY ts''',
+              (first_ts, bucket_seconds) + params)
 
     data = c.fetchall()
-    conn.close()
-    return [{'timestamp': row[0], 'balance': float(row[1])} for row in data]
+    return [{'timestamp': str(from_ts(row[0])), 'balance': decode_balance(row[1])} for row in data]
+
+
+def get_daily_history(start_day, end_day, room_identifier):
+    """获取按天汇总的历史数据，只读取汇总表，开销与天数成正比"""
+    with DB_SECONDS.time('daily_read'):
+        rows = get_db().execute('''SELECT day, open_balance, close_balance, min_balance, max_balance,
+                                         consumption, sample_count
+                                  FROM electricity_daily
+                                  WHERE room_identifier = ? AND day BETWEEN ? AND ?
+                                  ORDER BY day''',
+                                (room_identifier, start_day, end_day)).fetchall()
+    return [{
+        'timestamp': row[0],
+        'balance': float(row[2]),  # 图表使用当天最后一次的电量
+        'open': float(row[1]),
+        'close': float(row[2]),
+        'min': float(row[3]),
+        'max': float(row[4]),
+        'consumption': round(float(row[5]), 2),
+        'samples': row[6]
+    } for row in rows]
 
 
 def get_current_room_data():
@@ -187,17 +579,18 @@ def get_current_room_data():
     current_url = config['electricity_params']['url']
     room_identifier, _, _, _ = get_room_identifier(current_url)
 
-    return get_electricity_history(30, room_identifier)
+    return get_electricity_history(30, room_identifier, HISTORY_MAX_POINTS)
 
 
-def send_multichannel_notify(title, content, push_params, room_identifier=""):
+def send_multichannel_notify(title, content, push_params, room_identifier="", channel_content=None):
     """
     向多个渠道发送推送消息，支持群组推送
+
+    消息按渠道加入后台分发队列后立即返回，由分发线程并行投递并在失败时重试；
+    channel_content 可为个别渠道（如按字数计费的短信）指定替代内容；
+    返回值表示是否已成功入队
     """
-    current_time = datetime.now().strftime('%H:%M:%S')
     try:
-
-        results = []
         channels = push_params.get('channel', [])
         token = push_params.get('token', '')
         topic = push_params.get('topic', '')  # 获取群组编码
@@ -212,106 +605,468 @@ def send_multichannel_notify(title, content, push_params, room_identifier=""):
 
         logger.info(f"开始推送消息，渠道: {channels}, 群组: {topic or '个人'}, token: {token[:8]}...")
 
-        for channel in channels:
-            try:
-                # 创建推送实例，传入群组编码
-                push = PushPlusNotifier(token=token, channel=channel, topic=topic)
+        queued = notify_dispatcher.submit(token, channels, topic, title, content, channel_content=channel_content)
+        logger.info(f"推送已入队: {queued}/{len(channels)} 个渠道")
 
-                # 发送消息
-                result = push.pushplus_notify(title, content)
-                results.append(result)
+        return queued > 0
 
-                if result:
-                    logger.info(f"向渠道 {channel} 发送通知成功")
-                    if room_identifier:
-                        LAST_PUSH_TIME[room_identifier] = current_time
-                else:
-                    logger.error(f"向渠道 {channel} 发送通知失败")
+    except Exception as e:
+        logger.error(f"多渠道推送失败: {str(e)}")
+        return False
 
-            except Exception as e:
-                logger.error(f"向渠道 {channel} 发送通知异常: {str(e)}")
-                results.append(False)
 
-        success_count = sum(results)
-        logger.info(f"推送完成: {success_count}/{len(channels)} 个渠道成功")
+def get_room_urls(config):
+    """获取所有需要监控的房间URL，主URL在前，去重"""
+    urls = [config['electricity_params'].get('url', '')] + config.get('room_urls', [])
+    return [url for url in dict.fromkeys(urls) if url]
 
-        return any(results)
 
-    except Exception as e:
-        logger.error(f"多渠道推送失败: {str(e)}")
+def evaluate_alert(balance, url, config):
+    """检查阈值和耗尽预测，经告警状态机去重后返回需要发送的告警，无需提醒时返回None"""
+    room_identifier = get_room_identifier(url)[0]
+    threshold = config.get('threshold', 20.0)
+    forecast_hours = config.get('forecast_hours', 0)
+    forecast = get_forecast(room_identifier)
+    hours_to_empty = forecast['hours_to_empty'] if forecast else None
+    runs_out_soon = bool(forecast_hours) and hours_to_empty is not None and hours_to_empty < forecast_hours
+
+    alert_engine.cooldown_seconds = config.get('alert_cooldown', DEFAULT_CONFIG['alert_cooldown']) * 60
+    if not alert_engine.evaluate(room_identifier, float(balance) < threshold or runs_out_soon, float(balance)):
+        return None
+
+    return {
+        'room_identifier': room_identifier,
+        'room_info': parse_room_info(url)[0],
+        'url': url,
+        'balance': balance,
+        'hours_to_empty': hours_to_empty
+    }
+
+
+def send_alert(alert, config):
+    """发送单个房间的低电量通知，成功入队后才记录提醒并进入冷却期"""
+    push_params = config['push_params']
+    title = "电量告急"
+    content = f"{alert['room_info']}现在还剩电量：{alert['balance']}度，请及时充值"
+    if alert['hours_to_empty'] is not None:
+        content += f"（按当前用电速度预计约{alert['hours_to_empty']}小时后用完）"
+
+    # 使用多渠道推送
+    if not send_multichannel_notify(title, content, push_params, alert['room_identifier']):
         return False
+    alert_engine.record_push(alert['room_identifier'])
+    return True
+
+
+def send_alert_digest(alerts, config):
+    """把一轮查询中的多个告警合并为一条消息，每个渠道/群组只推送一次，返回是否成功入队"""
+    if len(alerts) == 1:
+        return send_alert(alerts[0], config)
+
+    msg_generator = AlertDigestGenerator(alerts, config.get('default_recharge_amount', 100))
+    logger.info(f"合并推送 {len(alerts)} 个房间的低电量提醒")
+    if not send_multichannel_notify(msg_generator.generate_title(), msg_generator.generate_html(),
+                                    config['push_params'], channel_content={'sms': msg_generator.generate_text()}):
+        return False
+    # 合并消息入队后才记录各房间的提醒，入队失败时下一轮重新提醒
+    for alert in alerts:
+        alert_engine.record_push(alert['room_identifier'])
+    return True
+
+
+def check_threshold_and_notify(balance, url, config):
+    """检查阈值和耗尽预测，发送低电量通知"""
+    alert = evaluate_alert(balance, url, config)
+    if alert is None:
+        return False
+    return send_alert(alert, config)
+
+
+def poll_rooms(room_urls, config):
+    """并发查询一组房间，保存数据并检查告警，返回 [(url, balance), ...]"""
+    params = config['electricity_params']
+    poll_params = config.get('poll_params', DEFAULT_CONFIG['poll_params'])
+    poller = RoomPoller(**poll_params)
+    results = poller.poll([dict(params, url=url) for url in room_urls])
+
+    digest = config.get('alert_digest', True)
+    alerts = []
+    for url, balance in results:
+        if balance is not None:
+            save_electricity_data(balance, url)
+            logger.info(f"定时任务 - 电量查询成功: {balance}度")
+
+            # 检查阈值，汇总模式下本轮结束后统一发送
+            alert = evaluate_alert(balance, url, config)
+            if alert is not None:
+                if digest:
+                    alerts.append(alert)
+                else:
+                    send_alert(alert, config)
+        else:
+            logger.error(f"定时任务 - 电量查询失败: {url}")
 
+    if alerts:
+        send_alert_digest(alerts, config)
 
+    # 本轮样本立即落盘，页面无需等待写入间隔
+    sample_writer.flush()
+
+    stats = get_connection_stats()
+    logger.info(f"连接复用统计: 新建{stats['connections_opened']}个, 复用{stats['connections_reused']}次")
+    return results
+
+
+@contextmanager
+def measure_job(job, interval_seconds):
+    """记录定时任务耗时，超过调度间隔时计为一次超时（下一次执行会被跳过或推迟）"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        JOB_SECONDS.observe(elapsed, job)
+        if elapsed > interval_seconds:
+            JOB_OVERRUNS.inc(job)
+            logger.warning(f"定时任务 {job} 执行{elapsed:.1f}秒，超过调度间隔{interval_seconds:.0f}秒")
+
+
+def on_job_skipped(event):
+    """上一次执行尚未结束或错过执行时间，本次执行被调度器跳过"""
+    JOB_SKIPPED.inc(event.job_id)
+    logger.warning(f"定时任务 {event.job_id} 本次执行被跳过")
 
 
 def electricity_query_task():
-    """定时查询电量任务，防止重复执行"""
+    """定时查询电量任务，并发查询所有已登记房间"""
     # 获取任务锁，防止重复执行
     try:
         with app.app_context():
             config = get_config()
-            params = config['electricity_params']
             query_interval = config.get('query_interval', 30)
+            room_urls = get_room_urls(config)
 
-            logger.info(f"执行定时电量查询，间隔: {query_interval}分钟")
+            logger.info(f"执行定时电量查询，间隔: {query_interval}分钟，房间数: {len(room_urls)}")
+            with measure_job('electricity_query_task', max(1, query_interval) * 60):
+                poll_rooms(room_urls, config)
 
-            balance = ElectricityQuery(**params).query()
-            if balance is not None:
-                save_electricity_data(balance, params['url'])
-                logger.info(f"定时任务 - 电量查询成功: {balance}度")
+    except Exception as e:
+        logger.error(f"定时任务执行失败: {e}")
 
-                # 检查阈值并发送通知
-                threshold = config.get('threshold', 20.0)
-                if float(balance) < threshold:
-                    room_info = parse_room_info(params['url'])[0]
-                    push_params = config['push_params']
-                    title = "电量告急"
-                    content = f"{room_info}现在还剩电量：{balance}度，请及时充值"
 
-                    # 使用多渠道推送
-                    send_multichannel_notify(title, content, push_params)
-            else:
-                logger.error("定时任务 - 电量查询失败")
+def electricity_spread_task():
+    """分散查询任务：每个节拍只查询已到期的房间，并按电量状况调整各房间的查询频率"""
+    try:
+        with app.app_context():
+            config = get_config()
+            base_seconds = max(1, config.get('query_interval', 30)) * 60
+            due_urls = poll_planner.due_rooms(get_room_urls(config), base_seconds)
+            if not due_urls:
+                return
+
+            logger.info(f"执行分散电量查询，到期房间数: {len(due_urls)}")
+            threshold = config.get('threshold', 20.0)
+            forecast_hours = config.get('forecast_hours', 0)
+            with measure_job('electricity_spread_task', SPREAD_TICK_SECONDS):
+                results = poll_rooms(due_urls, config)
+            for url, balance in results:
+                forecast = consumption_estimator.forecast(get_room_identifier(url)[0]) if balance is not None else None
+                hours_to_empty = forecast['hours_to_empty'] if forecast else None
+                factor = poll_planner.adaptive_factor(balance, threshold, hours_to_empty, forecast_hours)
+                poll_planner.record(url, base_seconds, factor)
 
     except Exception as e:
-        logger.error(f"定时任务执行失败: {e}")
+        logger.error(f"分散查询任务执行失败: {e}")
+
+
+def retention_task():
+    """定时任务：把过期的原始样本汇总为小时数据并分批删除，删除过期的小时数据"""
+    try:
+        with app.app_context():
+            config = get_config()
+            with measure_job('retention_task', RETENTION_INTERVAL_MINUTES * 60):
+                retention_manager.run(
+                    config.get('raw_retention_days', DEFAULT_CONFIG['raw_retention_days']),
+                    config.get('hourly_retention_months', DEFAULT_CONFIG['hourly_retention_months']))
+    except Exception as e:
+        logger.error(f"数据压缩任务执行失败: {e}")
+
+
+def backfill_daily(deadline):
+    """按房间回填按天汇总，每个房间一个事务，返回是否已全部完成
+
+    进度只记在进程内：回填只补充缺失的日期，重启后从头执行也不会重复累加
+    """
+    global _backfill_room_key
+    conn = get_db()
+    for room_key, room_identifier in sample_store.rooms():
+        if room_key <= _backfill_room_key:
+            continue
+        if time.monotonic() >= deadline:
+            return False
+        with conn:
+            added = conn.execute(DAILY_BACKFILL_SQL, (room_key,)).rowcount
+        if added > 0:
+            logger.info(f"房间 {room_identifier} 已根据历史数据回填 {added} 条按天汇总")
+        _backfill_room_key = room_key
+    return True
+
+
+# 按天汇总已回填到的房间键
+_backfill_room_key = 0
+
+
+def migration_task():
+    """定时任务：分批把旧表 electricity_data 的样本迁移到 samples 表，
+    复制完成后回填按天汇总，再删除旧表并移除任务"""
+    try:
+        deadline = time.monotonic() + MIGRATION_TIME_BUDGET
+        pending = True
+        while pending and sample_store.migration_pending() and time.monotonic() < deadline:
+            pending = sample_store.migrate_step()
+        if pending and not sample_store.migration_pending() and backfill_daily(deadline):
+            # 复制和回填完成后只需等待删除旧表
+            pending = sample_store.migrate_step()
+        if not pending:
+            scheduler.remove_job(MIGRATION_JOB_ID)
+    except Exception as e:
+        logger.error(f"样本迁移任务执行失败: {e}")
 
 
 # 在app.py中修改调度器设置
 def setup_scheduler():
-    """设置或更新定时任务"""
+    """设置或更新定时任务
+
+    任务已存在时通过 modify/reschedule 原地修改执行函数和触发器，
+    正在执行的查询不受影响，也无需重启应用
+    """
     global current_scheduler_job
 
     try:
-        # 移除现有的定时任务
-        if current_scheduler_job:
-            scheduler.remove_job(current_scheduler_job)
-            logger.info("移除现有定时任务")
-
         # 获取当前配置的查询间隔
         config = get_config()
         query_interval = config.get('query_interval', 30)  # 默认30分钟
 
-        # 确保间隔至少为5分钟，避免频率过高
+        # 确保间隔至少为1分钟，避免频率过高
         if query_interval < 1:
             query_interval = 1
             logger.warning(f"查询间隔过短，已调整为{query_interval}分钟")
 
-        # 添加新的定时任务，使用唯一ID
-        current_scheduler_job = scheduler.add_job(
-            func=electricity_query_task,
-            trigger='interval',
-            minutes=query_interval,
-            id='electricity_query',
-            name='electricity_query_task',
-            replace_existing=True,
-            max_instances=1  # 确保只有一个实例运行
-        )
-
-        logger.info(f"设置定时任务成功，间隔: {query_interval}分钟")
+        if config.get('schedule_mode', 'sweep') == 'spread':
+            # 分散模式：短节拍检查到期房间，各房间查询时间错开并自适应调整
+            func, name = electricity_spread_task, 'electricity_spread_task'
+            interval = timedelta(seconds=SPREAD_TICK_SECONDS)
+        else:
+            func, name = electricity_query_task, 'electricity_query_task'
+            interval = timedelta(minutes=query_interval)
+
+        job = scheduler.get_job(SCHEDULER_JOB_ID)
+        if job is None:
+            # 添加新的定时任务，使用唯一ID
+            current_scheduler_job = scheduler.add_job(
+                id=SCHEDULER_JOB_ID,
+                func=func,
+                trigger='interval',
+                seconds=interval.total_seconds(),
+                name=name,
+                replace_existing=True,
+                max_instances=1  # 确保只有一个实例运行
+            )
+        elif job.func is not func or getattr(job.trigger, 'interval', None) != interval:
+            # 原地修改任务，下次执行时间按新间隔重新计算
+            current_scheduler_job = scheduler.modify_job(
+                SCHEDULER_JOB_ID,
+                func=func,
+                name=name,
+                trigger='interval',
+                seconds=interval.total_seconds()
+            )
+            logger.info("已原地更新定时任务")
+        else:
+            current_scheduler_job = job
+
+        # 原始样本压缩任务，与查询任务一样只在持有调度器租约的进程中运行
+        if scheduler.get_job(RETENTION_JOB_ID) is None:
+            scheduler.add_job(
+                id=RETENTION_JOB_ID,
+                func=retention_task,
+                trigger='interval',
+                minutes=RETENTION_INTERVAL_MINUTES,
+                name='retention_task',
+                replace_existing=True,
+                max_instances=1
+            )
+
+        # 旧数据库的样本迁移任务，完成后自行移除
+        if scheduler.get_job(MIGRATION_JOB_ID) is None and sample_store.legacy_exists():
+            scheduler.add_job(
+                id=MIGRATION_JOB_ID,
+                func=migration_task,
+                trigger='interval',
+                seconds=MIGRATION_INTERVAL_SECONDS,
+                name='migration_task',
+                replace_existing=True,
+                max_instances=1
+            )
+
+        # 查询间隔变化后，分散模式下重新错开各房间
+        if func is electricity_spread_task and poll_planner.base_seconds != query_interval * 60:
+            poll_planner.reschedule(query_interval * 60)
+
+        logger.info(f"设置定时任务成功，模式: {name}，间隔: {query_interval}分钟")
 
     except Exception as e:
         logger.error(f"设置定时任务失败: {e}")
+
+
+def start_scheduler():
+    """设置定时任务并启动（或恢复）调度器，本进程成为唯一运行定时任务的进程"""
+    global scheduler_active
+    scheduler_active = True
+    setup_scheduler()
+    if not scheduler.running:
+        scheduler.start()
+    else:
+        scheduler.resume()
+
+
+def stop_scheduler():
+    """暂停调度器，已在执行的查询不受影响"""
+    global scheduler_active
+    scheduler_active = False
+    if scheduler.running:
+        scheduler.pause()
+
+
+# 多进程部署时通过数据库租约选出唯一运行定时任务的进程，持有者退出或失联后由其他进程接管
+def on_lease_renewed():
+    """每次续期租约后检查配置是否变化（变化时由配置回调重新设置定时任务），并发布本进程的运行状态"""
+    get_config()
+    status_board.publish(scheduler_lease.owner)
+
+
+def on_lease_heartbeat():
+    """每个进程每次尝试续期租约后发布本进程的监控指标，任一进程输出指标时合并各进程的指标"""
+    status_board.publish_process('metrics', scheduler_lease.owner, Metrics.collect())
+
+
+scheduler_lease = SchedulerLease(on_acquired=start_scheduler, on_lost=stop_scheduler,
+                                 on_renewed=on_lease_renewed, on_heartbeat=on_lease_heartbeat)
+
+
+def start_services(elect_scheduler=True, init_database=True):
+    """
+    初始化数据库并启动后台服务，开发服务器和WSGI入口共用
+
+    Args:
+        elect_scheduler (bool): 是否参与调度器选举；为 False 时本进程只提供页面和API
+        init_database (bool): 是否初始化数据库；gunicorn 在主进程中已初始化一次时为 False
+    """
+    if init_database:
+        init_db()
+
+    # 启动推送分发线程，退出前投递完队列中的消息
+    notify_dispatcher.start()
+    atexit.register(notify_dispatcher.shutdown)
+
+    if elect_scheduler:
+        scheduler_lease.start()
+        # 先于推送队列和写入缓冲执行（atexit按注册的相反顺序执行），释放租约后其他进程立即接管
+        atexit.register(scheduler_lease.release)
+
+
+# 配置保存后，负责定时任务的进程重新设置定时任务
+register_config_listener(lambda config: setup_scheduler() if scheduler_active else None)
+# 统计被跳过的定时任务执行
+scheduler.add_listener(on_job_skipped, EVENT_JOB_MAX_INSTANCES | EVENT_JOB_MISSED)
+
+
+def collect_runtime_metrics():
+    """输出指标时采集熔断器、推送队列、写入缓冲和条件请求的当前状态"""
+    breakers = get_breaker_states()
+    notify = notify_dispatcher.status()
+    writer = sample_writer.status()
+    conditional = get_conditional_stats()
+    return [
+        ('circuit_breaker_open', 'gauge', '熔断器是否处于熔断或半开状态',
+         [({'host': host}, int(state['state'] != 'closed')) for host, state in breakers.items()]),
+        ('circuit_breaker_trips_total', 'counter', '熔断次数',
+         [({'host': host}, state['trips']) for host, state in breakers.items()]),
+        ('circuit_breaker_rejected_total', 'counter', '熔断期间直接拒绝的请求数',
+         [({'host': host}, state['rejected']) for host, state in breakers.items()]),
+        ('notify_queue_depth', 'gauge', '推送队列中等待投递的消息数', [({}, notify['queue_depth'])]),
+        ('notify_pending_retries', 'gauge', '等待重试的推送数', [({}, notify['pending_retries'])]),
+        ('notify_jobs_total', 'counter', '推送分发结果',
+         [({'result': result}, notify[result]) for result in ('delivered', 'failed', 'retried', 'dropped')]),
+        ('sample_writer_buffered', 'gauge', '写入缓冲中的样本数', [({}, writer['buffered'])]),
+        ('sample_writer_dropped_total', 'counter', '写入失败后丢弃的样本数', [({}, writer['dropped'])]),
+        ('electricity_conditional_total', 'counter', '条件请求和页面未变化的次数',
+         [({'result': result}, count) for result, count in conditional.items()])
+    ]
+
+
+Metrics.register_collector(collect_runtime_metrics)
+
+
+def scheduler_status():
+    """调度器状态和各定时任务的触发器、下次执行时间"""
+    jobs = []
+    for job in scheduler.get_jobs():
+        next_run_time = getattr(job, 'next_run_time', None)
+        jobs.append({
+            'id': job.id,
+            'name': job.name,
+            'trigger': str(job.trigger),
+            'next_run_time': next_run_time.isoformat() if next_run_time else None
+        })
+    return {
+        'running': scheduler.running,
+        'active': scheduler_active,
+        'config_version': get_config_version(),
+        'jobs': jobs
+    }
+
+
+def notify_status():
+    """推送队列状态和各渠道推送耗时"""
+    status = notify_dispatcher.status()
+    status['channel_latency'] = get_latency_stats()
+    return status
+
+
+def connection_stats():
+    """电量查询的连接复用统计和条件请求命中情况"""
+    stats = get_connection_stats()
+    stats['conditional'] = get_conditional_stats()
+    return stats
+
+
+def write_stats():
+    """写入缓冲统计和各房间的写入状态"""
+    return {
+        'buffer': sample_writer.status(),
+        'rooms': sample_filter.snapshot()
+    }
+
+
+# 只在运行定时任务的进程内变化的状态，由该进程每次续期租约时发布
+status_board.register('scheduler', scheduler_status)
+status_board.register('poll_plan', poll_planner.snapshot)
+status_board.register('notify_status', notify_status)
+status_board.register('circuit_breaker', get_breaker_states)
+status_board.register('connection_stats', connection_stats)
+status_board.register('write_stats', write_stats)
+status_board.register('parse_stats', get_strategy_stats)
+
+
+def leader_status(name, local):
+    """本进程运行定时任务时返回本进程的状态，否则返回运行定时任务的进程最近一次发布的状态"""
+    if scheduler_active:
+        return local()
+    published = status_board.read(name)
+    return local() if published is None else published
+
+
 # 路由定义
 @app.route('/')
 def index():
@@ -361,9 +1116,9 @@ def api_test_push():
         # 根据是否设置了群组编码，返回不同的消息
         topic = push_params.get('topic', '')
         if topic:
-            message = f'推送测试成功，请检查群组所有成员是否收到消息（群组编码: {topic}）'
+            message = f'推送已提交，请检查群组所有成员是否收到消息（群组编码: {topic}）'
         else:
-            message = '推送测试成功，请检查个人是否收到消息（未设置群组编码）'
+            message = '推送已提交，请检查个人是否收到消息（未设置群组编码）'
 
         if result:
             return jsonify({
@@ -386,11 +1141,14 @@ def api_test_push():
 
 @app.route('/api/history')
 def api_history():
-    """API接口：获取历史数据，支持房间筛选"""
+    """API接口：获取历史数据，支持房间筛选和降采样（points=0 返回全部原始数据）"""
     range_type = request.args.get('range', 'month')
     room_identifier = request.args.get('room', None)
+    max_points = request.args.get('points', HISTORY_MAX_POINTS, type=int)
 
-    if range_type == 'week':
+    if range_type == 'year':
+        days = 365
+    elif range_type == 'week':
         days = 7
     elif range_type == 'day':
         days = 1
@@ -403,10 +1161,125 @@ def api_history():
         current_url = config['electricity_params']['url']
         room_identifier, _, _, _ = get_room_identifier(current_url)
 
-    data = get_electricity_history(days, room_identifier)
+    data = get_electricity_history(days, room_identifier, max_points)
     return jsonify(data)
 
 
+@app.route('/api/history/daily')
+def api_history_daily():
+    """API接口：获取自定义时间段的按天汇总数据"""
+    start = request.args.get('start', '')
+    end = request.args.get('end', '')
+    room_identifier = request.args.get('room', None)
+
+    try:
+        start_day = datetime.strptime(start, '%Y-%m-%d').strftime('%Y-%m-%d')
+        end_day = datetime.strptime(end, '%Y-%m-%d').strftime('%Y-%m-%d')
+    except ValueError:
+        return jsonify({
+            'status': 'error',
+            'message': '日期格式错误，应为YYYY-MM-DD'
+        }), 400
+
+    # 如果没有指定房间，使用当前配置的房间
+    if not room_identifier:
+        config = get_config()
+        room_identifier, _, _, _ = get_room_identifier(config['electricity_params']['url'])
+
+    return jsonify(get_daily_history(start_day, end_day, room_identifier))
+
+
+@app.route('/api/forecast')
+def api_forecast():
+    """API接口：获取房间的用电速率和电量耗尽预测"""
+    room_identifier = request.args.get('room', None)
+
+    # 如果没有指定房间，使用当前配置的房间
+    if not room_identifier:
+        config = get_config()
+        room_identifier, _, _, _ = get_room_identifier(config['electricity_params']['url'])
+
+    forecast = get_forecast(room_identifier)
+    if forecast is None:
+        return jsonify({
+            'status': 'error',
+            'message': '暂无该房间的电量数据'
+        }), 404
+    return jsonify(forecast)
+
+
+@app.route('/api/scheduler')
+def api_scheduler():
+    """API接口：获取定时任务的触发器和下次执行时间，用于确认配置修改已生效"""
+    status = dict(leader_status('scheduler', scheduler_status))
+    status['lease'] = scheduler_lease.snapshot()
+    return jsonify(status)
+
+
+@app.route('/api/poll-plan')
+def api_poll_plan():
+    """API接口：获取分散查询模式下各房间的查询间隔和下次查询倒计时"""
+    return jsonify(leader_status('poll_plan', poll_planner.snapshot))
+
+
+@app.route('/api/alert-state')
+def api_alert_state():
+    """API接口：获取各房间的告警状态"""
+    return jsonify(alert_engine.snapshot())
+
+
+@app.route('/api/notify-status')
+def api_notify_status():
+    """API接口：获取推送队列深度、投递延迟和各渠道推送耗时"""
+    return jsonify(leader_status('notify_status', notify_status))
+
+
+@app.route('/api/circuit-breaker')
+def api_circuit_breaker():
+    """API接口：获取各主机熔断器的状态"""
+    return jsonify(leader_status('circuit_breaker', get_breaker_states))
+
+
+@app.route('/metrics')
+def metrics():
+    """Prometheus格式的监控指标，合并各进程的指标（本进程为当前值，其他进程为最近一次发布的值），按 worker 标签区分"""
+    owner = scheduler_lease.owner
+    sources = [({'worker': owner}, Metrics.collect())]
+    sources += [({'worker': worker}, families)
+                for worker, families in status_board.read_processes('metrics', scheduler_lease.ttl_seconds)
+                if worker != owner]
+    return Response(Metrics.render(sources), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@app.route('/api/connection-stats')
+def api_connection_stats():
+    """API接口：获取电量查询的连接复用统计和条件请求命中情况"""
+    return jsonify(leader_status('connection_stats', connection_stats))
+
+
+@app.route('/api/write-stats')
+def api_write_stats():
+    """API接口：获取写入缓冲统计，以及各房间最近写入、最近查询的时间和省略写入的样本数"""
+    return jsonify(leader_status('write_stats', write_stats))
+
+
+@app.route('/api/retention')
+def api_retention():
+    """API接口：获取原始样本、小时汇总和按天汇总的行数，数据库大小和最近一次压缩的统计"""
+    config = get_config()
+    status = retention_manager.status()
+    status['raw_retention_days'] = config.get('raw_retention_days', DEFAULT_CONFIG['raw_retention_days'])
+    status['hourly_retention_months'] = config.get('hourly_retention_months',
+                                                   DEFAULT_CONFIG['hourly_retention_months'])
+    return jsonify(status)
+
+
+@app.route('/api/parse-stats')
+def api_parse_stats():
+    """API接口：获取各解析策略的命中次数"""
+    return jsonify(leader_status('parse_stats', get_strategy_stats))
+
+
 @app.route('/api/room-info')
 def api_room_info():
     """API接口：获取当前配置的房间信息"""
@@ -441,23 +1314,16 @@ def api_measure():
         params = config['electricity_params']
 
         # 执行电量查询
-        balance = ElectricityQuery(**params).query()
+        # 与定时查询共用主机并发上限
+        balance = RoomPoller(**config.get('poll_params', DEFAULT_CONFIG['poll_params'])).poll_one(params)
         if balance is not None:
             # 保存数据（自动按房间隔离）
             save_electricity_data(balance, params['url'])
+            sample_writer.flush()
             logger.info(f"手动测量成功: {balance}度")
 
             # 检查阈值并发送通知
-            threshold = config.get('threshold', 20.0)
-            if float(balance) < threshold:
-                room_info = parse_room_info(params['url'])[0]
-                push_params = config['push_params']
-
-                title = "电量告急"
-                content = f"{room_info}现在还剩电量：{balance}度，请及时充值"
-
-                # 使用多渠道推送
-                send_multichannel_notify(title, content, push_params)
+            if check_threshold_and_notify(balance, params['url'], config):
                 logger.info("低电量通知已发送")
 
             # 返回最新数据
@@ -506,10 +1372,25 @@ def config():
         topic = request.form.get('topic', '').strip()
         default_recharge_amount = int(request.form.get('default_recharge_amount', 100))
 
-        # 更新配置
-        new_config = {
+        # 额外监控的房间URL，每行一个
+        room_urls = [line.strip() for line in request.form.get('room_urls', '').splitlines()
+                     if line.strip().startswith('http')]
+
+        # 更新配置，未在表单中出现的配置项保留原值
+        new_config = dict(config_data)
+        new_config.update({
             'threshold': float(request.form.get('threshold', 20)),
+            'forecast_hours': float(request.form.get('forecast_hours', config_data.get('forecast_hours', 24))),
+            'alert_cooldown': int(request.form.get('alert_cooldown', config_data.get('alert_cooldown', 360))),
+            'alert_digest': request.form.get('alert_digest') == 'on',
             'query_interval': int(request.form.get('query_interval', 30)),
+            'schedule_mode': request.form.get('schedule_mode', config_data.get('schedule_mode', 'sweep')),
+            'write_mode': request.form.get('write_mode', config_data.get('write_mode', 'changes')),
+            'heartbeat_interval': int(request.form.get('heartbeat_interval', config_data.get('heartbeat_interval', 360))),
+            'raw_retention_days': int(request.form.get('raw_retention_days',
+                                                       config_data.get('raw_retention_days', 90))),
+            'hourly_retention_months': int(request.form.get('hourly_retention_months',
+                                                            config_data.get('hourly_retention_months', 12))),
             'default_recharge_amount': default_recharge_amount,  # 新增
             'electricity_params': {
                 'url': request.form.get('electricity_url', ''),
@@ -520,8 +1401,9 @@ def config():
                 'token': request.form.get('push_token', ''),
                 'channel': valid_channels,
                 'topic': topic
-            }
-        }
+            },
+            'room_urls': room_urls
+        })
 
         # 保存配置
         save_config(new_config)
@@ -545,37 +1427,33 @@ def api_quick_recharge():
         # 获取默认充值金额
         amount = config.get('default_recharge_amount', 100)
 
-        # 生成充值URL
+        # 生成充值URL和消息（按房间和金额缓存）
         query_url = config['electricity_params']['url']
-        recharge_url = generate_recharge_url(query_url, amount)
+        message = build_recharge_message(query_url, amount)
 
-        if not recharge_url:
+        if not message:
             return jsonify({
                 'status': 'error',
                 'message': '生成充值链接失败，请检查电费查询URL配置'
             }), 400
 
-        # 使用WechatMsgGenerator生成消息
-        msg_generator = WechatMsgGenerator(recharge_url)
-        title = msg_generator.generate_title()
-        html_content = msg_generator.generate_html()
+        recharge_url, title, html_content, text_content = message
 
         # 只通过微信通道推送
         push_params = config['push_params'].copy()
         push_params['channel'] = ['wechat']  # 强制使用微信通道
 
-        # 获取房间标识符并确保其在LAST_PUSH_TIME中初始化
+        # 获取房间标识符
         room_identifier, _, _, _ = get_room_identifier(query_url)
-        if room_identifier not in LAST_PUSH_TIME:
-            LAST_PUSH_TIME[room_identifier] = 0
 
         # 发送推送
-        result = send_multichannel_notify(title, html_content, push_params, room_identifier)
+        result = send_multichannel_notify(title, html_content, push_params, room_identifier,
+                                          channel_content={'sms': text_content})
 
         if result:
             return jsonify({
                 'status': 'success',
-                'message': f'充值链接已发送到微信，金额{amount}元'
+                'message': f'充值链接已提交发送到微信，金额{amount}元'
             })
         else:
             return jsonify({
@@ -598,14 +1476,9 @@ def api_quick_recharge():
         }), 500
 
 if __name__ == '__main__':
-    # 初始化数据库
-    init_db()
-
-    # 设置定时任务
-    setup_scheduler()
-
-    # 启动调度器
-    scheduler.start()
+    # 初始化数据库，启动推送分发线程，并通过租约启动定时任务
+    # （与WSGI部署的进程共用数据库时不会重复查询）；生产环境请使用 wsgi.py
+    start_services()
 
     # 启动应用
     app.run(host='0.0.0.0', port=8080, debug=True,use_reloader=False)
@@ -0,0 +1,152 @@
+"""
+历史查询基准：按旧表结构批量写入样本，在线迁移到 samples 表，
+对比两种表结构的行大小、索引大小和按房间时间范围读取的耗时，并检查查询计划
+
+用法:
+    python benchmarks/bench_history.py [--rows 2000000] [--rooms 200] [--db bench_history.db]
+"""
+import argparse
+import logging
+import os
+import sqlite3
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Database  # noqa: E402
+import app  # noqa: E402
+from SampleStore import to_ts  # noqa: E402
+
+# 旧版本的样本表结构
+LEGACY_DDL = ('''CREATE TABLE electricity_data
+                 (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                  timestamp DATETIME,
+                  balance REAL,
+                  room_identifier TEXT,
+                  area_id TEXT,
+                  build_id TEXT,
+                  room_id TEXT)''',
+              '''CREATE INDEX idx_electricity_room_time ON electricity_data (room_identifier, timestamp)''')
+
+LEGACY_SQL = '''SELECT timestamp, balance FROM electricity_data
+                WHERE timestamp > ? AND room_identifier = ?
+                ORDER BY timestamp'''
+
+HISTORY_SQL = '''SELECT ts, balance FROM samples
+                 WHERE ts > ? AND room_key = ?
+                 ORDER BY ts'''
+
+
+def seed_legacy(conn, rows, rooms):
+    """按每分钟一个样本，为每个房间写入旧表结构的数据"""
+    for statement in LEGACY_DDL:
+        conn.execute(statement)
+    per_room = rows // rooms
+    start = datetime.now() - timedelta(minutes=per_room)
+    batch = []
+    for room in range(rooms):
+        room_identifier = f"area2_build3_room{room}"
+        for minute in range(per_room):
+            batch.append((start + timedelta(minutes=minute), 100 - minute * 0.001,
+                          room_identifier, '2', '3', str(room)))
+            if len(batch) >= 50000:
+                conn.executemany('''INSERT INTO electricity_data
+                                    (timestamp, balance, room_identifier, area_id, build_id, room_id)
+                                    VALUES (?, ?, ?, ?, ?, ?)''', batch)
+                batch.clear()
+    if batch:
+        conn.executemany('''INSERT INTO electricity_data
+                            (timestamp, balance, room_identifier, area_id, build_id, room_id)
+                            VALUES (?, ?, ?, ?, ?, ?)''', batch)
+    conn.commit()
+
+
+def table_bytes(conn, names):
+    """表和索引占用的字节数，SQLite 未编译 dbstat 时返回 None"""
+    try:
+        placeholders = ','.join('?' * len(names))
+        row = conn.execute(f"SELECT SUM(pgsize) FROM dbstat WHERE name IN ({placeholders})", names).fetchone()
+        return row[0]
+    except sqlite3.OperationalError:
+        return None
+
+
+def time_scan(conn, sql, params, repeat=20):
+    """重复执行范围读取（在SQLite内聚合，不计Python逐行转换的开销），返回行数和平均耗时(ms)"""
+    started = time.perf_counter()
+    for _ in range(repeat):
+        count = conn.execute(f"SELECT COUNT(*), MIN(balance) FROM ({sql})", params).fetchone()[0]
+    return count, (time.perf_counter() - started) * 1000 / repeat
+
+
+def main():
+    parser = argparse.ArgumentParser(description='历史查询基准')
+    parser.add_argument('--rows', type=int, default=2000000, help='写入的样本总数 (默认: 2000000)')
+    parser.add_argument('--rooms', type=int, default=200, help='房间数量 (默认: 200)')
+    parser.add_argument('--db', default='bench_history.db', help='基准使用的数据库文件 (默认: bench_history.db)')
+    parser.add_argument('--keep', action='store_true', help='结束后保留数据库文件')
+    args = parser.parse_args()
+
+    logging.disable(logging.INFO)
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(args.db + suffix):
+            os.remove(args.db + suffix)
+
+    Database.db_manager.close_all()
+    Database.db_manager.db_path = args.db
+    conn = Database.get_db()
+
+    started = time.perf_counter()
+    seed_legacy(conn, args.rows, args.rooms)
+    print(f"按旧表结构写入 {args.rows} 行，耗时 {time.perf_counter() - started:.1f}s")
+
+    # 初始化时登记迁移任务，迁移按批执行，期间读取合并未迁移的旧样本
+    app.init_db()
+    app.sample_store.drop_delay = 0
+    started = time.perf_counter()
+    while app.sample_store.migration_pending():
+        app.sample_store.migrate_step()
+    elapsed = time.perf_counter() - started
+    print(f"在线迁移 {args.rows} 行，耗时 {elapsed:.1f}s ({args.rows / elapsed:.0f} 行/秒)")
+
+    room_identifier = f"area2_build3_room{args.rooms // 2}"
+    room_key = app.sample_store.room_key(room_identifier, create=False)
+    start_date = datetime.now() - timedelta(days=30)
+
+    plan = ' '.join(row[-1] for row in conn.execute('EXPLAIN QUERY PLAN ' + HISTORY_SQL,
+                                                    (to_ts(start_date), room_key)))
+    print(f"查询计划: {plan}")
+    assert 'PRIMARY KEY' in plan, '历史查询未使用 (room_key, ts) 主键'
+    assert 'TEMP B-TREE' not in plan, '历史查询需要额外排序'
+
+    legacy_bytes = table_bytes(conn, ('electricity_data', 'idx_electricity_room_time'))
+    v2_bytes = table_bytes(conn, ('samples',))
+    if legacy_bytes and v2_bytes:
+        print(f"旧表+索引: {legacy_bytes / args.rows:.1f} 字节/行，"
+              f"samples: {v2_bytes / args.rows:.1f} 字节/行 (缩小 {legacy_bytes / v2_bytes:.1f} 倍)")
+
+    legacy_rows, legacy_ms = time_scan(conn, LEGACY_SQL, (start_date, room_identifier))
+    v2_rows, v2_ms = time_scan(conn, HISTORY_SQL, (to_ts(start_date), room_key))
+    print(f"30天范围读取: 旧表 {legacy_rows} 行 {legacy_ms:.2f}ms，"
+          f"samples {v2_rows} 行 {v2_ms:.2f}ms (快 {legacy_ms / v2_ms:.1f} 倍)")
+
+    # 删除旧表后只读取 samples
+    app.sample_store.migrate_step()
+    assert not app.sample_store.legacy_exists(), '迁移完成后旧表未删除'
+
+    for days in (1, 7, 30):
+        started = time.perf_counter()
+        data = app.get_electricity_history(days, room_identifier)
+        print(f"{days:>2}天历史: {len(data)} 行，耗时 {(time.perf_counter() - started) * 1000:.1f}ms")
+
+    Database.db_manager.close_all()
+    if not args.keep:
+        for suffix in ('', '-wal', '-shm'):
+            if os.path.exists(args.db + suffix):
+                os.remove(args.db + suffix)
+
+
+if __name__ == '__main__':
+    main()
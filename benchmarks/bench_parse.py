@@ -0,0 +1,84 @@
+"""
+电量解析微基准：比较正则/lxml快速路径与BeautifulSoup解析的耗时
+
+用法:
+    python benchmarks/bench_parse.py [debug_final.html ...] [--number 2000]
+
+不传入文件时使用内置的示例页面；可以传入 ElectricityQuery.save_debug_info 保存的页面。
+"""
+import argparse
+import logging
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from ElectricityQuery import ElectricityQuery, HAS_LXML  # noqa: E402
+
+# 仿照eleresult页面结构的示例页面
+SAMPLE_PAGE = """<!DOCTYPE html>
+<html>
+<head><meta charset="utf-8"><title>电费查询</title></head>
+<body>
+<div class="page">
+  <div class="weui-cells weui-cells_form">
+    <div class="weui-cell">
+      <div class="weui-cell__hd"><label class="weui-label">校区</label></div>
+      <div class="weui-cell__bd">奉贤校区</div>
+    </div>
+    <div class="weui-cell">
+      <div class="weui-cell__hd"><label class="weui-label">房间</label></div>
+      <div class="weui-cell__bd">3号楼103</div>
+    </div>
+""" + "".join(f"""    <div class="weui-cell">
+      <div class="weui-cell__hd"><label class="weui-label">说明{i}</label></div>
+      <div class="weui-cell__bd">第{i}条提示信息</div>
+    </div>
+""" for i in range(40)) + """    <div class="weui-cell">
+      <label class="weui-label">剩余电量</label>
+      <div>42.17度</div>
+    </div>
+  </div>
+  <input type="hidden" id="roomdef" left-degree="42.17" />
+</div>
+</body>
+</html>"""
+
+# 各解析路径对应的策略子集
+PATHS = {
+    'regex': ('left_degree_regex', 'weui_label_regex'),
+    'soup': ('weui_label', 'roomdef_attr', 'weui_cell_scan'),
+}
+if HAS_LXML:
+    PATHS['lxml'] = ('lxml_weui_cell',)
+
+
+def bench_page(name, html, number):
+    """对单个页面运行各解析路径并打印平均耗时"""
+    query = ElectricityQuery(url='')
+    print(f"\n页面: {name} ({len(html)} 字节)")
+    for path, strategies in PATHS.items():
+        balance, strategy = query.parse_balance(html, strategies)
+        seconds = timeit.timeit(lambda: query.parse_balance(html, strategies), number=number)
+        print(f"  {path:<6} {seconds / number * 1e6:10.1f} us/次  结果={balance} 策略={strategy}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='电量解析微基准')
+    parser.add_argument('files', nargs='*', help='保存的页面文件，如 debug_final.html')
+    parser.add_argument('--number', type=int, default=2000, help='每个路径的重复次数 (默认: 2000)')
+    args = parser.parse_args()
+
+    # 屏蔽解析过程中的INFO日志，避免影响计时
+    logging.disable(logging.INFO)
+
+    if not args.files:
+        bench_page('内置示例页面', SAMPLE_PAGE, args.number)
+    for path in args.files:
+        with open(path, encoding='utf-8') as f:
+            bench_page(path, f.read(), args.number)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,310 @@
+"""
+端到端基准：启动本地的电量查询页面和PushPlus替身服务器，测量整轮查询吞吐量、单房间查询延迟和推送吞吐量
+
+替身服务器可以设置延迟、抖动和错误率，不访问 yktyd.ecust.edu.cn 和 www.pushplus.plus；
+查询和推送的地址（即 ELECTRICITY_BASE_URL / PUSHPLUS_BASE_URL 对应的默认值）指向替身服务器。
+
+用法:
+    python benchmarks/bench_sweep.py [--rooms 200] [--sweeps 3] [--latency 0.05] [--error-rate 0.01]
+                                     [--push-latency 0.1] [--push-error-rate 0.02] [--messages 200]
+"""
+import argparse
+import hashlib
+import json
+import logging
+import os
+import random
+import socket
+import struct
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Pushplus  # noqa: E402
+import ElectricityQuery as electricity_query  # noqa: E402
+from bench_parse import SAMPLE_PAGE  # noqa: E402
+
+ROOM_URL = 'https://yktyd.ecust.edu.cn/epay/wxpage/wanxiao/eleresult?sysid=1&roomid={room}&areaid=2&buildid=3'
+LOW_BALANCE_EVERY = 10  # 每隔多少个房间有一个低于阈值的房间，用于触发告警推送
+# PushPlus替身的失败类型及比例：HTTP 5xx 和连接重置可重试，业务错误（HTTP 200 + code 500）不重试
+PUSH_FAILURE_KINDS = (('http_5xx', 0.4), ('reset', 0.3), ('business', 0.3))
+
+
+def percentile(values, fraction):
+    """已排序列表的百分位数"""
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+class StubBehavior:
+    """替身服务器的延迟和错误设置"""
+
+    def __init__(self, latency, jitter, error_rate):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests = 0
+        self.errors = 0
+        self.lock = threading.Lock()
+
+    def delay_and_fail(self):
+        """模拟网络和服务端耗时，返回本次是否应返回错误"""
+        delay = max(0.0, self.latency + random.uniform(-self.jitter, self.jitter))
+        if delay:
+            time.sleep(delay)
+        failed = random.random() < self.error_rate
+        with self.lock:
+            self.requests += 1
+            self.errors += int(failed)
+        return failed
+
+
+def make_campus_handler(behavior, static, etag):
+    """电量查询页面替身：按roomid返回电量，static 为 False 时每次请求电量下降0.01度"""
+    request_counts = {}
+    counts_lock = threading.Lock()
+
+    class CampusHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'  # 支持长连接，与真实服务端一致
+
+        def do_GET(self):
+            failed = behavior.delay_and_fail()
+            if failed:
+                self._send(500, b'server error', 'text/plain')
+                return
+
+            room = int(parse_qs(urlparse(self.path).query).get('roomid', ['0'])[0] or 0)
+            with counts_lock:
+                count = request_counts.get(room, 0)
+                request_counts[room] = count + 1
+            base = 5.0 if room % LOW_BALANCE_EVERY == 0 else 50.0 + room % 37
+            balance = base if static else max(0.0, base - count * 0.01)
+            body = SAMPLE_PAGE.replace('42.17', f'{balance:.2f}').encode('utf-8')
+
+            tag = '"' + hashlib.md5(body).hexdigest() + '"'
+            if etag and self.headers.get('If-None-Match') == tag:
+                self._send(304, b'', None, tag)
+                return
+            self._send(200, body, 'text/html; charset=utf-8', tag if etag else None)
+
+        def _send(self, status, body, content_type, tag=None):
+            self.send_response(status)
+            if content_type:
+                self.send_header('Content-Type', content_type)
+            if tag:
+                self.send_header('ETag', tag)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    return CampusHandler
+
+
+def make_pushplus_handler(behavior):
+    """PushPlus替身：返回与 /send 接口相同结构的JSON，失败按 PUSH_FAILURE_KINDS 的比例分为不同类型"""
+    failures = {kind: 0 for kind, _ in PUSH_FAILURE_KINDS}
+    failures_lock = threading.Lock()
+
+    def pick_failure():
+        draw = random.random()
+        for kind, fraction in PUSH_FAILURE_KINDS:
+            draw -= fraction
+            if draw < 0:
+                break
+        with failures_lock:
+            failures[kind] += 1
+        return kind
+
+    class PushPlusHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def do_POST(self):
+            self.rfile.read(int(self.headers.get('Content-Length', 0)))
+            status = 200
+            failure = pick_failure() if behavior.delay_and_fail() else None
+            if failure == 'reset':
+                # 不返回响应，直接以RST关闭连接
+                self.connection.setsockopt(socket.SOL_SOCKET, socket.SO_LINGER, struct.pack('ii', 1, 0))
+                self.close_connection = True
+                return
+            if failure == 'http_5xx':
+                status = 503
+                reply = {'code': 503, 'msg': '服务暂不可用', 'data': None}
+            elif failure == 'business':
+                reply = {'code': 500, 'msg': '服务端繁忙', 'data': None}
+            else:
+                reply = {'code': 200, 'msg': '请求成功', 'data': hashlib.md5(os.urandom(8)).hexdigest()}
+            body = json.dumps(reply, ensure_ascii=False).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    PushPlusHandler.failures = failures
+    return PushPlusHandler
+
+
+def start_server(handler):
+    """在后台线程启动替身服务器，返回 (server, base_url)"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f'http://127.0.0.1:{server.server_port}'
+
+
+def bench_sweeps(app, args, room_urls):
+    """通过 app.poll_rooms 执行完整的查询轮次（查询、解析、保存、告警），统计吞吐量和单房间延迟"""
+    from RoomPoller import RoomPoller
+
+    latencies = []
+    latencies_lock = threading.Lock()
+    original_poll_one = RoomPoller._poll_one
+
+    def timed_poll_one(self, params, deadline):
+        started = time.perf_counter()
+        try:
+            return original_poll_one(self, params, deadline)
+        finally:
+            with latencies_lock:
+                latencies.append(time.perf_counter() - started)
+
+    config = json.loads(json.dumps(app.DEFAULT_CONFIG))
+    config['electricity_params']['url'] = room_urls[0]
+    config['push_params'] = {'token': 'bench-token', 'channel': ['mail', 'wechat'], 'topic': ''}
+    config['poll_params'] = {'max_workers': args.workers, 'per_host_limit': args.per_host}
+
+    RoomPoller._poll_one = timed_poll_one
+    try:
+        print(f"\n整轮查询: {len(room_urls)}个房间 x {args.sweeps}轮, "
+              f"线程{args.workers}, 单主机并发{args.per_host}")
+        for sweep in range(args.sweeps):
+            started = time.perf_counter()
+            results = app.poll_rooms(room_urls, config)
+            elapsed = time.perf_counter() - started
+            succeeded = sum(1 for _, balance in results if balance is not None)
+            print(f"  第{sweep + 1}轮: {elapsed:7.2f}s  {len(room_urls) / elapsed:8.1f} 房间/秒  "
+                  f"成功{succeeded}/{len(room_urls)}")
+    finally:
+        RoomPoller._poll_one = original_poll_one
+
+    latencies.sort()
+    print(f"  单房间查询延迟(含等待主机并发名额): p50={percentile(latencies, 0.5) * 1000:.1f}ms  "
+          f"p99={percentile(latencies, 0.99) * 1000:.1f}ms  max={latencies[-1] * 1000:.1f}ms")
+
+
+def bench_notify(args):
+    """向独立的推送分发队列提交消息，统计推送吞吐量和入队到完成的延迟"""
+    from NotifyDispatcher import NotifyDispatcher
+
+    dispatcher = NotifyDispatcher(workers=args.notify_workers, backoff_base=args.retry_backoff)
+    done = threading.Event()
+    latencies, outcomes = [], {'success': 0, 'failure': 0}
+    lock = threading.Lock()
+
+    def callback(job, success):
+        with lock:
+            latencies.append(time.monotonic() - job.enqueued_at)
+            outcomes['success' if success else 'failure'] += 1
+            if len(latencies) >= args.messages:
+                done.set()
+
+    print(f"\n推送: {args.messages}条消息, 分发线程{args.notify_workers}")
+    started = time.perf_counter()
+    for index in range(args.messages):
+        dispatcher.submit('bench-token', ['mail'], '', f'基准测试{index}', '电量基准测试消息', callback=callback)
+    done.wait(timeout=max(60.0, args.messages * (args.push_latency + 0.05)))
+    elapsed = time.perf_counter() - started
+    dispatcher.shutdown()
+
+    latencies.sort()
+    print(f"  耗时{elapsed:.2f}s  {len(latencies) / elapsed:8.1f} 条/秒  "
+          f"成功{outcomes['success']} 失败{outcomes['failure']} 重试{dispatcher.status()['retried']}")
+    if latencies:
+        print(f"  入队到完成延迟: p50={percentile(latencies, 0.5) * 1000:.1f}ms  "
+              f"p99={percentile(latencies, 0.99) * 1000:.1f}ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='端到端查询和推送基准')
+    parser.add_argument('--rooms', type=int, default=200, help='房间数量 (默认: 200)')
+    parser.add_argument('--sweeps', type=int, default=3, help='查询轮数 (默认: 3)')
+    parser.add_argument('--workers', type=int, default=16, help='查询线程数 (默认: 16)')
+    parser.add_argument('--per-host', type=int, default=4, help='单主机最大并发数 (默认: 4)')
+    parser.add_argument('--latency', type=float, default=0.05, help='查询页面平均延迟(秒) (默认: 0.05)')
+    parser.add_argument('--jitter', type=float, default=0.02, help='延迟抖动(秒) (默认: 0.02)')
+    parser.add_argument('--error-rate', type=float, default=0.01, help='查询页面返回500的比例 (默认: 0.01)')
+    parser.add_argument('--static', action='store_true', help='电量保持不变（测试变化抑制和未变化页面的复用）')
+    parser.add_argument('--etag', action='store_true', help='替身页面返回ETag并支持304')
+    parser.add_argument('--messages', type=int, default=200, help='推送消息数 (默认: 200)')
+    parser.add_argument('--notify-workers', type=int, default=4, help='推送分发线程数 (默认: 4)')
+    parser.add_argument('--push-latency', type=float, default=0.1, help='PushPlus平均延迟(秒) (默认: 0.1)')
+    parser.add_argument('--push-error-rate', type=float, default=0.02,
+                        help='PushPlus返回失败的比例，其中七成可重试 (默认: 0.02)')
+    parser.add_argument('--retry-backoff', type=float, default=0.05, help='推送重试退避基数(秒) (默认: 0.05)')
+    parser.add_argument('--db', default='bench_sweep.db', help='基准使用的数据库文件 (默认: bench_sweep.db)')
+    parser.add_argument('--keep', action='store_true', help='结束后保留数据库文件')
+    args = parser.parse_args()
+
+    # 屏蔽日志（替身服务器按错误率返回的失败也会记录ERROR），避免影响计时和输出
+    logging.disable(logging.ERROR)
+
+    campus_behavior = StubBehavior(args.latency, args.jitter, args.error_rate)
+    push_behavior = StubBehavior(args.push_latency, args.push_latency / 5, args.push_error_rate)
+    campus_server, campus_url = start_server(make_campus_handler(campus_behavior, args.static, args.etag))
+    push_handler = make_pushplus_handler(push_behavior)
+    push_server, push_url = start_server(push_handler)
+
+    # 模块已导入，环境变量不再生效，直接替换默认地址
+    electricity_query.DEFAULT_BASE_URL = campus_url
+    Pushplus.DEFAULT_BASE_URL = push_url + '/send'
+
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(args.db + suffix):
+            os.remove(args.db + suffix)
+
+    import Database
+    Database.db_manager.close_all()
+    Database.db_manager.db_path = args.db
+    import app
+    from CircuitBreaker import get_breaker_states
+
+    try:
+        app.init_db()
+        room_urls = [ROOM_URL.format(room=room) for room in range(1, args.rooms + 1)]
+        bench_sweeps(app, args, room_urls)
+        app.notify_dispatcher.shutdown()
+        bench_notify(args)
+
+        print(f"\n替身页面: 请求{campus_behavior.requests}次, 返回错误{campus_behavior.errors}次")
+        print(f"替身PushPlus: 请求{push_behavior.requests}次, 返回失败{push_behavior.errors}次 "
+              f"(HTTP 5xx {push_handler.failures['http_5xx']}, 连接重置 {push_handler.failures['reset']}, "
+              f"业务错误 {push_handler.failures['business']})")
+        print(f"连接复用: {electricity_query.get_connection_stats()}")
+        print(f"条件请求: {electricity_query.get_conditional_stats()}")
+        print(f"写入缓冲: {app.sample_writer.status()}")
+        print(f"熔断器: {get_breaker_states()}")
+    finally:
+        campus_server.shutdown()
+        push_server.shutdown()
+        app.sample_writer.close()
+        Database.db_manager.close_all()
+        if not args.keep:
+            for suffix in ('', '-wal', '-shm'):
+                if os.path.exists(args.db + suffix):
+                    os.remove(args.db + suffix)
+
+
+if __name__ == '__main__':
+    main()
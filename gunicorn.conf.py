@@ -0,0 +1,31 @@
+# gunicorn 配置：gunicorn -c gunicorn.conf.py wsgi:application
+import multiprocessing
+import os
+import subprocess
+import sys
+
+bind = os.environ.get('BIND', '0.0.0.0:8080')
+# 工作进程数，默认按CPU核数，最多8个；每个进程内再用线程处理并发请求
+workers = int(os.environ.get('WEB_CONCURRENCY', min(multiprocessing.cpu_count() * 2 + 1, 8)))
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 4))
+timeout = 60
+# 退出时等待进行中的请求和 atexit 钩子（写入缓冲、推送队列、释放租约）的时间；
+# 容器的停止等待时间（docker compose 的 stop_grace_period）需大于该值，否则工作进程会被直接杀死
+graceful_timeout = int(os.environ.get('GRACEFUL_TIMEOUT', 30))
+# 不预加载应用：每个工作进程各自导入应用，数据库连接和后台线程不会跨fork共享
+preload_app = False
+accesslog = '-'
+
+# 工作进程读取该环境变量，跳过数据库初始化
+DB_INITIALIZED_ENV = 'ELECTRICITY_DB_INITIALIZED'
+
+
+def on_starting(server):
+    """启动工作进程前初始化一次数据库（建表、结构升级），避免各工作进程同时执行时争用写锁
+
+    在子进程中执行，主进程不导入应用，工作进程仍各自导入
+    """
+    subprocess.run([sys.executable, '-c', 'from app import init_db; init_db()'],
+                   cwd=server.cfg.chdir, check=True)
+    os.environ[DB_INITIALIZED_ENV] = '1'
@@ -0,0 +1,93 @@
+"""
+旧表 electricity_data 在线迁移到 samples 表的测试
+
+用法:
+    python -m pytest tests
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Database  # noqa: E402
+from SampleStore import SampleStore, LEGACY_ROOM, to_ts  # noqa: E402
+
+LEGACY_DDL = '''CREATE TABLE electricity_data
+                (id INTEGER PRIMARY KEY AUTOINCREMENT,
+                 timestamp DATETIME,
+                 balance REAL,
+                 room_identifier TEXT,
+                 area_id TEXT,
+                 build_id TEXT,
+                 room_id TEXT)'''
+
+START = datetime(2024, 3, 1, 8, 0, 0)
+
+
+@pytest.fixture
+def conn(tmp_path):
+    """使用临时数据库，写入旧表样本：两个房间各60分钟，另有空值行、同一秒的重复行和无房间标识的行"""
+    Database.db_manager.close_all()
+    Database.db_manager.db_path = str(tmp_path / 'electricity.db')
+    conn = Database.get_db()
+    conn.execute(LEGACY_DDL)
+    rows = []
+    for minute in range(60):
+        moment = START + timedelta(minutes=minute)
+        rows.append((moment, 50 - minute * 0.01, 'area2_build3_room1'))
+        rows.append((moment, 80 - minute * 0.02, 'area2_build3_room2'))
+    rows.append((START, 49.5, 'area2_build3_room1'))  # 同一秒的重复样本
+    rows.append((START + timedelta(minutes=1), None, 'area2_build3_room1'))  # 电量为空
+    rows.append((None, 30.0, 'area2_build3_room2'))  # 时间为空
+    rows.append((START, 10.0, None))  # 旧版本没有房间标识
+    conn.executemany("INSERT INTO electricity_data (timestamp, balance, room_identifier) VALUES (?, ?, ?)", rows)
+    conn.commit()
+    SampleStore.init_table(conn)
+    conn.commit()
+    yield conn
+    Database.db_manager.close_all()
+
+
+def read_room(store, room_identifier):
+    """按迁移期间的读取方式读取一个房间的样本"""
+    room_key = store.room_key(room_identifier, create=False)
+    return Database.get_db().execute(f'''SELECT ts, balance FROM {store.source()}
+                                         WHERE room_key = ? ORDER BY ts''', (room_key,)).fetchall()
+
+
+def test_migration_keeps_reads_complete_and_drops_legacy(conn):
+    store = SampleStore(migration_batch=25, drop_delay=0)
+
+    # 初始化时登记旧表中的房间，迁移开始前和迁移期间每批读取都能看到该房间的全部样本
+    assert store.migration_pending()
+    while store.migration_pending():
+        rows = read_room(store, 'area2_build3_room1')
+        assert len({ts for ts, _ in rows}) == 60
+        assert rows[0][0] == to_ts(START)
+        assert store.migrate_step()
+
+    assert store.legacy_exists()
+    assert not store.migrate_step()
+    assert not store.legacy_exists()
+    assert len(read_room(store, 'area2_build3_room1')) == 60
+    assert len(read_room(store, 'area2_build3_room2')) == 60
+    assert len(read_room(store, LEGACY_ROOM)) == 1
+
+
+def test_migration_refuses_to_drop_when_samples_are_missing(conn):
+    store = SampleStore(migration_batch=1000, drop_delay=0)
+    assert store.migrate_step()
+    assert store.migration_pending()
+
+    # 模拟复制丢失：核对发生在标记复制完成之前
+    room_key = store.room_key('area2_build3_room2', create=False)
+    with conn:
+        conn.execute("DELETE FROM samples WHERE room_key = ? AND ts = ?", (room_key, to_ts(START)))
+
+    assert store.verify_copy(conn) == [('area2_build3_room2', 60, 1)]
+    assert not store.migrate_step()
+    assert store.migration_pending()
+    assert store.legacy_exists()
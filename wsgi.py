@@ -0,0 +1,17 @@
+"""
+生产环境WSGI入口
+
+用法:
+    gunicorn -c gunicorn.conf.py wsgi:application
+
+每个工作进程都提供页面和API，通过数据库中的调度器租约只选出一个进程运行定时查询和提醒；
+持有租约的进程退出后，其他进程在续期时接管（异常退出时最多等待租约有效期）。
+数据库由 gunicorn.conf.py 在主进程启动时初始化一次，不使用该配置启动时由工作进程各自初始化。
+"""
+import os
+
+from app import app, start_services
+
+start_services(init_database=not os.environ.get('ELECTRICITY_DB_INITIALIZED'))
+
+application = app